@@ -5,14 +5,17 @@ from typing import Dict
 from fastapi import APIRouter, Request, HTTPException
 from starlette.responses import Response, JSONResponse
 
+from app.responses import ORJSONResponse
+
 admin_router = APIRouter(prefix="/admin", tags=["admin"])
 
 
 @admin_router.get("/status")
-async def get_all_status(request: Request) -> Dict[str, object]:
+async def get_all_status(request: Request) -> ORJSONResponse:
     """Get status of all API keys in the pool."""
     key_manager = request.app.state.key_manager
-    return await key_manager.get_status()
+    # Returned directly so large pools skip FastAPI's jsonable_encoder walk.
+    return ORJSONResponse(content=await key_manager.get_status())
 
 
 @admin_router.get("/status/{key_id}")
@@ -1,16 +1,35 @@
 """Configuration management for Gemini Proxy."""
 
+import functools
 import os
+import sys
 from dataclasses import dataclass
-from typing import List
+from typing import Optional, Tuple
 from dotenv import load_dotenv
 
+# slots= is only accepted by dataclass() from Python 3.10 onwards.
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+# Every variable load_config reads; their values key the parse cache.
+_ENV_VARS = (
+    "GEMINI_API_KEYS",
+    "PORT",
+    "HOST",
+    "DEFAULT_RPD_LIMIT",
+    "DEFAULT_RPM_LIMIT",
+    "MAX_RETRIES",
+    "RETRY_DELAY_SECONDS",
+    "GEMINI_BASE_URL",
+    "LOG_LEVEL",
+    "REDIS_URL",
+)
+
+
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class Config:
     """Application configuration loaded from environment variables."""
 
-    api_keys: List[str]
+    api_keys: Tuple[str, ...]
     port: int = 8000
     host: str = "0.0.0.0"
     default_rpd_limit: int = 250
@@ -19,6 +38,7 @@ class Config:
     retry_delay_seconds: int = 2
     gemini_base_url: str = "https://generativelanguage.googleapis.com"
     log_level: str = "INFO"
+    redis_url: Optional[str] = None
 
     def __post_init__(self):
         if not self.api_keys:
@@ -43,19 +63,32 @@ def load_config(*, use_dotenv: bool = True) -> Config:
     if use_dotenv:
         load_dotenv()
 
-    api_keys_raw = os.getenv("GEMINI_API_KEYS", "")
-    api_keys = [key.strip() for key in api_keys_raw.split(",") if key.strip()]
+    return _load_cached(tuple(os.environ.get(name) for name in _ENV_VARS))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_cached(env_snapshot: Tuple[Optional[str], ...]) -> Config:
+    """Parse a snapshot of _ENV_VARS; repeat loads of an unchanged env are free."""
+    env = dict(zip(_ENV_VARS, env_snapshot))
+
+    def getenv(name: str, default: str) -> str:
+        value = env[name]
+        return default if value is None else value
+
+    api_keys_raw = getenv("GEMINI_API_KEYS", "")
+    api_keys = tuple(key.strip() for key in api_keys_raw.split(",") if key.strip())
 
     return Config(
         api_keys=api_keys,
-        port=int(os.getenv("PORT", "8000")),
-        host=os.getenv("HOST", "0.0.0.0"),
-        default_rpd_limit=int(os.getenv("DEFAULT_RPD_LIMIT", "250")),
-        default_rpm_limit=int(os.getenv("DEFAULT_RPM_LIMIT", "10")),
-        max_retries=int(os.getenv("MAX_RETRIES", "3")),
-        retry_delay_seconds=int(os.getenv("RETRY_DELAY_SECONDS", "2")),
-        gemini_base_url=os.getenv(
+        port=int(getenv("PORT", "8000")),
+        host=getenv("HOST", "0.0.0.0"),
+        default_rpd_limit=int(getenv("DEFAULT_RPD_LIMIT", "250")),
+        default_rpm_limit=int(getenv("DEFAULT_RPM_LIMIT", "10")),
+        max_retries=int(getenv("MAX_RETRIES", "3")),
+        retry_delay_seconds=int(getenv("RETRY_DELAY_SECONDS", "2")),
+        gemini_base_url=getenv(
             "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"
         ),
-        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        log_level=getenv("LOG_LEVEL", "INFO"),
+        redis_url=env["REDIS_URL"] or None,
     )
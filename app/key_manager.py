@@ -1,9 +1,11 @@
 """Key pool management."""
 
 import asyncio
+import heapq
+import logging
 import time
-from datetime import datetime, timedelta, timezone, tzinfo
-from typing import Dict, Optional, cast
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, cast
 
 try:
     from zoneinfo import ZoneInfo  # type: ignore
@@ -13,70 +15,205 @@ except ImportError:  # pragma: no cover - Python < 3.9 fallback
 from app.config import Config
 from app.models import ApiKey, PoolState, STATUS_ACTIVE, STATUS_EXHAUSTED
 
+logger = logging.getLogger(__name__)
+
+# Gemini quotas reset at midnight Pacific time.
+_PACIFIC_TZ = cast(tzinfo, ZoneInfo("America/Los_Angeles"))
+
+# Upper bound on queued usage records applied per writer pass.
+_WRITE_BATCH_SIZE = 256
+
 
 class KeyManager:
     """Manages API key pool with rate limits."""
 
     def __init__(self, config: Config):
         self.pool: PoolState = PoolState()
-        self._lock: asyncio.Lock = asyncio.Lock()
-
-        for index, api_key in enumerate(config.api_keys, start=1):
+        # Guards pool structure (add/remove/reset); per-key counters have
+        # their own locks so usage on different keys is recorded in parallel.
+        self._pool_lock: asyncio.Lock = asyncio.Lock()
+        self._key_locks: Dict[str, asyncio.Lock] = {}
+        self._write_queue: Optional["asyncio.Queue[Tuple[str, float]]"] = None
+        self._writer_task: Optional["asyncio.Task[None]"] = None
+        self._status_cache: Optional[Dict[str, object]] = None
+        self._status_cache_at: float = 0.0
+        self._status_inflight: Optional["asyncio.Task[Dict[str, object]]"] = None
+
+        self._next_id_counter: int = 0
+        self._key_to_id: Dict[str, str] = {}
+        self._load_keys(
+            config.api_keys, config.default_rpd_limit, config.default_rpm_limit
+        )
+
+    def _load_keys(
+        self, api_keys: Sequence[str], rpd_limit: int, rpm_limit: int
+    ) -> None:
+        for index, api_key in enumerate(api_keys, start=1):
             key_id = f"key_{index}"
             self.pool.keys[key_id] = ApiKey(
                 id=key_id,
                 key=api_key,
-                rpd_limit=config.default_rpd_limit,
-                rpm_limit=config.default_rpm_limit,
+                rpd_limit=rpd_limit,
+                rpm_limit=rpm_limit,
             )
+            self._key_locks[key_id] = asyncio.Lock()
 
-        pacific_tz = cast(tzinfo, ZoneInfo("America/Los_Angeles"))
-        now_pacific = datetime.now(pacific_tz)
-        self.pool.last_reset_date = now_pacific.date()
+        self._next_id_counter = len(api_keys)
+        self._key_to_id = {key.key: key.id for key in self.pool.keys.values()}
+        self.pool.last_reset_date = datetime.now(_PACIFIC_TZ).date()
 
     async def select_key(self) -> Optional[ApiKey]:
         await self.check_and_reset_daily()
+        return self._pick_key()
 
-        async with self._lock:
-            cutoff_time = time.time() - 60
-            for key in self.pool.keys.values():
-                key.rpm_timestamps = [
-                    ts for ts in key.rpm_timestamps if ts > cutoff_time
-                ]
-
-            available_keys = [
-                key
-                for key in self.pool.keys.values()
-                if key.status == STATUS_ACTIVE
-                and key.rpd_remaining > 0
-                and key.rpm_current < key.rpm_limit
-            ]
-
-            if not available_keys:
-                return None
-
-            available_keys.sort(key=lambda item: item.rpd_remaining, reverse=True)
-            return available_keys[0]
+    async def select_keys(self, count: int) -> List[ApiKey]:
+        """Return up to ``count`` distinct available keys, best first."""
+        await self.check_and_reset_daily()
+        return self._pick_keys(count)
+
+    def _available_keys(self) -> Iterator[ApiKey]:
+        # Read-only scan with no awaits, so it cannot interleave with writers.
+        return (
+            key
+            for key in list(self.pool.keys.values())
+            if key.status == STATUS_ACTIVE
+            and key.rpd_remaining > 0
+            and key.rpm_current < key.rpm_limit
+        )
+
+    def _pick_key(self) -> Optional[ApiKey]:
+        # max() keeps the first of equal candidates, matching the old
+        # stable descending sort without the O(N log N) cost.
+        return max(
+            self._available_keys(), key=lambda item: item.rpd_remaining, default=None
+        )
+
+    def _pick_keys(self, count: int) -> List[ApiKey]:
+        return heapq.nlargest(
+            count, self._available_keys(), key=lambda item: item.rpd_remaining
+        )
 
     async def record_request(self, key_id: str) -> None:
-        async with self._lock:
+        queue = self._write_queue
+        if queue is not None and self._writer_running():
+            queue.put_nowait((key_id, time.time()))
+            return
+
+        key = self.pool.keys.get(key_id)
+        if not key:
+            return
+
+        async with self._key_lock(key_id):
+            self._apply_request(key, time.time())
+
+    async def record_requests_batch(self, key_id: str, count: int) -> None:
+        """Record ``count`` requests for one key under a single lock acquisition."""
+        key = self.pool.keys.get(key_id)
+        if not key or count <= 0:
+            return
+
+        async with self._key_lock(key_id):
+            self._apply_request(key, time.time(), count)
+
+    def _apply_request(self, key: ApiKey, timestamp: float, count: int = 1) -> None:
+        key.rpd_used += count
+        if count == 1:
+            key.rpm_timestamps.append(timestamp)
+        else:
+            key.rpm_timestamps.extend([timestamp] * count)
+        key.last_used = datetime.fromtimestamp(timestamp, timezone.utc)
+
+        if key.rpd_used >= key.rpd_limit:
+            key.status = STATUS_EXHAUSTED
+
+    def start_writer(self) -> None:
+        """Apply record_request calls in batches from a background task.
+
+        Until stop_writer() is called, record_request only enqueues and the
+        writer applies pending usage in one pass per batch. Counters may lag
+        by one event-loop tick, which is acceptable for quota tracking.
+        """
+        if self._writer_task is not None:
+            return
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._run_writer(self._write_queue))
+
+    async def stop_writer(self) -> None:
+        """Drain pending usage and stop the background writer."""
+        queue, task = self._write_queue, self._writer_task
+        if queue is None or task is None:
+            return
+        self._write_queue = None
+        self._writer_task = None
+
+        await self._wait_drained(queue, task)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("Usage writer crashed")
+
+        # Anything a dead writer left behind is applied directly.
+        while not queue.empty():
+            key_id, timestamp = queue.get_nowait()
             key = self.pool.keys.get(key_id)
-            if not key:
-                return
-
-            key.rpd_used += 1
-            key.rpm_timestamps.append(time.time())
-            key.last_used = datetime.now(timezone.utc)
-
-            if key.rpd_used >= key.rpd_limit:
-                key.status = STATUS_EXHAUSTED
+            if key:
+                self._apply_request(key, timestamp)
+
+    async def aclose(self) -> None:
+        """Release background resources held by the manager."""
+        await self.stop_writer()
+
+    async def flush(self) -> None:
+        """Wait until all usage queued so far has been applied."""
+        if self._write_queue is not None and self._writer_task is not None:
+            await self._wait_drained(self._write_queue, self._writer_task)
+
+    def _writer_running(self) -> bool:
+        return self._writer_task is not None and not self._writer_task.done()
+
+    async def _wait_drained(
+        self, queue: "asyncio.Queue[Tuple[str, float]]", task: "asyncio.Task[None]"
+    ) -> None:
+        # A writer that died never drains the queue, so join() alone could
+        # block forever; return as soon as either finishes.
+        joined = asyncio.ensure_future(queue.join())
+        try:
+            await asyncio.wait({joined, task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            joined.cancel()
+
+    async def _run_writer(self, queue: "asyncio.Queue[Tuple[str, float]]") -> None:
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < _WRITE_BATCH_SIZE:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            # Applied without yielding, so the whole batch is atomic with
+            # respect to other tasks and needs no per-key locking.
+            for key_id, timestamp in batch:
+                try:
+                    key = self.pool.keys.get(key_id)
+                    if key:
+                        self._apply_request(key, timestamp)
+                except Exception:
+                    # Keep the writer alive; one bad record must not stop
+                    # usage tracking for every later request.
+                    logger.exception("Failed to record usage for %s", key_id)
+                finally:
+                    queue.task_done()
 
     async def record_error(self, key_id: str, is_rpd_limit: bool = False) -> None:
-        async with self._lock:
-            key = self.pool.keys.get(key_id)
-            if not key:
-                return
+        key = self.pool.keys.get(key_id)
+        if not key:
+            return
 
+        async with self._key_lock(key_id):
             key.last_error = datetime.now(timezone.utc)
             key.consecutive_failures += 1
 
@@ -84,23 +221,33 @@ class KeyManager:
                 key.status = STATUS_EXHAUSTED
 
     async def check_and_reset_daily(self) -> None:
-        async with self._lock:
-            pacific_tz = cast(tzinfo, ZoneInfo("America/Los_Angeles"))
-            now_pacific = datetime.now(pacific_tz)
-            if (
-                self.pool.last_reset_date
-                and now_pacific.date() <= self.pool.last_reset_date
-            ):
+        today = datetime.now(_PACIFIC_TZ).date()
+        # Fast path: the date rarely rolls over, so skip the lock entirely.
+        if not self._needs_daily_reset(today):
+            return
+
+        async with self._pool_lock:
+            # Re-check: another task may have reset while we waited.
+            if not self._needs_daily_reset(today):
                 return
 
             self._reset_all_keys()
-            self.pool.last_reset_date = now_pacific.date()
+            self.pool.last_reset_date = today
+
+    def _needs_daily_reset(self, today: date) -> bool:
+        last_reset_date = self.pool.last_reset_date
+        return last_reset_date is None or today > last_reset_date
 
     async def force_reset(self) -> None:
-        async with self._lock:
+        async with self._pool_lock:
             self._reset_all_keys()
-            pacific_tz = cast(tzinfo, ZoneInfo("America/Los_Angeles"))
-            self.pool.last_reset_date = datetime.now(pacific_tz).date()
+            self.pool.last_reset_date = datetime.now(_PACIFIC_TZ).date()
+
+    def _key_lock(self, key_id: str) -> asyncio.Lock:
+        lock = self._key_locks.get(key_id)
+        if lock is None:
+            lock = self._key_locks[key_id] = asyncio.Lock()
+        return lock
 
     def _reset_all_keys(self) -> None:
         for key in self.pool.keys.values():
@@ -113,8 +260,8 @@ class KeyManager:
     async def add_key(
         self, api_key: str, rpd_limit: int = 250, rpm_limit: int = 10
     ) -> str:
-        async with self._lock:
-            if any(existing.key == api_key for existing in self.pool.keys.values()):
+        async with self._pool_lock:
+            if api_key in self._key_to_id:
                 raise ValueError("API key already exists")
 
             key_id = self._next_key_id()
@@ -124,17 +271,22 @@ class KeyManager:
                 rpd_limit=rpd_limit,
                 rpm_limit=rpm_limit,
             )
+            self._key_locks[key_id] = asyncio.Lock()
+            self._key_to_id[api_key] = key_id
             return key_id
 
     async def remove_key(self, key_id: str) -> bool:
-        async with self._lock:
-            if key_id not in self.pool.keys:
+        async with self._pool_lock:
+            key = self.pool.keys.pop(key_id, None)
+            if key is None:
                 return False
-            del self.pool.keys[key_id]
+            if self._key_to_id.get(key.key) == key_id:
+                del self._key_to_id[key.key]
+            self._key_locks.pop(key_id, None)
             return True
 
     async def get_status(self) -> Dict[str, object]:
-        async with self._lock:
+        async with self._pool_lock:
             available_keys = 0
             exhausted_keys = 0
 
@@ -163,8 +315,33 @@ class KeyManager:
                 ],
             }
 
+    async def get_status_cached(self, ttl: float = 1.0) -> Dict[str, object]:
+        """Return get_status(), reusing a result computed within ``ttl`` seconds.
+
+        Concurrent callers that miss the cache share a single computation.
+        """
+        if (
+            self._status_cache is not None
+            and time.monotonic() - self._status_cache_at < ttl
+        ):
+            return self._status_cache
+
+        if self._status_inflight is None:
+            self._status_inflight = asyncio.ensure_future(self._refresh_status_cache())
+        # Shielded so one cancelled caller does not abort the shared task.
+        return await asyncio.shield(self._status_inflight)
+
+    async def _refresh_status_cache(self) -> Dict[str, object]:
+        try:
+            status = await self.get_status()
+            self._status_cache = status
+            self._status_cache_at = time.monotonic()
+            return status
+        finally:
+            self._status_inflight = None
+
     async def get_key_status(self, key_id: str) -> Optional[Dict[str, object]]:
-        async with self._lock:
+        async with self._pool_lock:
             key = self.pool.keys.get(key_id)
             if not key:
                 return None
@@ -186,10 +363,6 @@ class KeyManager:
         }
 
     def _next_key_id(self) -> str:
-        max_id = 0
-        for key_id in self.pool.keys.keys():
-            if key_id.startswith("key_"):
-                suffix = key_id[4:]
-                if suffix.isdigit():
-                    max_id = max(max_id, int(suffix))
-        return f"key_{max_id + 1}"
+        # Monotonic so ids of removed keys are never handed out again.
+        self._next_id_counter += 1
+        return f"key_{self._next_id_counter}"
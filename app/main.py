@@ -1,16 +1,20 @@
 """FastAPI application for Gemini API key pool proxy."""
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from typing import Dict
 
 import httpx
 from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
 
 from app.config import load_config
 from app.key_manager import KeyManager
 from app.proxy import proxy_request
 from app.admin import admin_router
+from app.responses import ORJSONResponse
 from app.sdk_support import sdk_router
 
 logger = logging.getLogger(__name__)
@@ -29,21 +33,58 @@ async def lifespan(app: FastAPI):
         limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
     )
 
-    key_manager = KeyManager(config)
+    if config.redis_url:
+        # Imported lazily so the redis package is only needed when configured.
+        from app.redis_key_manager import RedisKeyManager
+
+        key_manager: KeyManager = RedisKeyManager.from_url(config, config.redis_url)
+    else:
+        key_manager = KeyManager(config)
+        key_manager.start_writer()
 
     app.state.config = config
     app.state.http_client = http_client
     app.state.key_manager = key_manager
 
-    logger.info("Gemini proxy started with %d keys", len(config.api_keys))
+    logger.info(
+        "Gemini proxy started with %d keys (event loop: %s)",
+        len(config.api_keys),
+        type(asyncio.get_running_loop()).__module__,
+    )
 
     yield
 
+    await key_manager.aclose()
     await http_client.aclose()
     logger.info("Gemini proxy stopped")
 
 
-app = FastAPI(title="Gemini API Key Pool Proxy", lifespan=lifespan)
+app = FastAPI(
+    title="Gemini API Key Pool Proxy",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+
+class AdminGZipMiddleware(GZipMiddleware):
+    """GZip limited to the admin API.
+
+    Proxied Gemini replies are streamed, so minimum_size never applies to them
+    and every reply would be recompressed on the hot path; they pass through
+    as Gemini sent them.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(
+            admin_router.prefix + "/"
+        ):
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+# Compress large admin status JSON; see AdminGZipMiddleware.
+app.add_middleware(AdminGZipMiddleware, minimum_size=1024)
 
 # Include routers BEFORE catch-all route
 app.include_router(admin_router)
@@ -53,7 +94,7 @@ app.include_router(sdk_router)
 @app.get("/")
 async def root(request: Request) -> Dict[str, object]:
     key_manager = request.app.state.key_manager
-    status = await key_manager.get_status()
+    status = await key_manager.get_status_cached()
     return {
         "service": "Gemini API Key Pool Proxy",
         "status": "running",
@@ -66,7 +107,7 @@ async def root(request: Request) -> Dict[str, object]:
 async def health_check(request: Request) -> Dict[str, object]:
     """Health check endpoint with key pool status."""
     key_manager = request.app.state.key_manager
-    status = await key_manager.get_status()
+    status = await key_manager.get_status_cached()
     return {
         "status": "healthy",
         "keys_available": status["available_keys"],
@@ -1,15 +1,18 @@
 """Data models for API key management."""
 
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime, date
-from typing import Dict, List, Optional
+from typing import Deque, Dict, Optional, Tuple
 import time
 
+from app.config import DATACLASS_SLOTS
+
 STATUS_ACTIVE = "active"
 STATUS_EXHAUSTED = "exhausted"
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class ApiKey:
     """Represents a single API key with usage tracking."""
 
@@ -18,11 +21,18 @@ class ApiKey:
     rpd_limit: int = 250
     rpm_limit: int = 10
     rpd_used: int = 0
-    rpm_timestamps: List[float] = field(default_factory=list)
+    rpm_timestamps: Deque[float] = field(default_factory=deque)
     last_used: Optional[datetime] = None
     last_error: Optional[datetime] = None
     consecutive_failures: int = 0
     status: str = STATUS_ACTIVE
+    # Precomputed auth header appended to every forwarded request.
+    auth_headers: Tuple[Tuple[str, str], ...] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        self.auth_headers = (("x-goog-api-key", self.key),)
 
     @property
     def rpd_remaining(self) -> int:
@@ -30,9 +40,12 @@ class ApiKey:
 
     @property
     def rpm_current(self) -> int:
-        current_time = time.time()
-        cutoff_time = current_time - 60
-        return sum(1 for ts in self.rpm_timestamps if ts > cutoff_time)
+        # Timestamps are appended in order, so expired entries sit on the left.
+        cutoff_time = time.time() - 60
+        timestamps = self.rpm_timestamps
+        while timestamps and timestamps[0] <= cutoff_time:
+            timestamps.popleft()
+        return len(timestamps)
 
     def key_prefix(self) -> str:
         if len(self.key) <= 11:
@@ -40,7 +53,7 @@ class ApiKey:
         return f"{self.key[:8]}...{self.key[-3:]}"
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class PoolState:
     """Represents the state of the entire API key pool."""
 
@@ -1,9 +1,11 @@
 import asyncio
 import logging
-from typing import Dict, List, Optional, Protocol, Tuple, Union, cast
-from urllib.parse import parse_qsl, urlencode
+from typing import AsyncIterator, List, Optional, Protocol, Tuple, cast
+from urllib.parse import parse_qsl
 
 import httpx
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
 from starlette.requests import Request
 from starlette.responses import Response, StreamingResponse
 
@@ -29,22 +31,53 @@ HOP_BY_HOP_HEADERS = frozenset(
 )
 
 
-def _prepare_headers(request_headers: Dict[str, str]) -> Dict[str, str]:
+# SSE bodies can stay open for minutes, so only the connect phase is bounded.
+_STREAMING_TIMEOUT = httpx.Timeout(10.0, read=None)
+
+# Byte-level view of the headers dropped from incoming requests, matched
+# against Starlette's raw header list without decoding every name first.
+_STRIPPED_REQUEST_HEADERS = frozenset(
+    name.encode("latin-1") for name in HOP_BY_HOP_HEADERS
+) | {b"x-goog-api-key"}
+
+
+def _prepare_headers(request_headers: Headers) -> List[Tuple[str, str]]:
     """Remove hop-by-hop headers and x-goog-api-key from incoming request."""
-    return {
-        k: v
-        for k, v in request_headers.items()
-        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != "x-goog-api-key"
-    }
+    return [
+        (name.decode("latin-1"), value.decode("latin-1"))
+        for name, value in request_headers.raw
+        if name.lower() not in _STRIPPED_REQUEST_HEADERS
+    ]
 
 
-def _strip_key_from_query(query_string: str) -> str:
-    """Remove ?key= parameter from query string if present."""
+def _query_params_without_key(query_string: str) -> List[Tuple[str, str]]:
+    """Parse the query string, dropping any ?key= parameter."""
     if not query_string:
-        return ""
-    params = [(k, v) for k, v in parse_qsl(query_string, keep_blank_values=True)]
-    filtered = [(k, v) for k, v in params if k != "key"]
-    return urlencode(filtered, doseq=True)
+        return []
+    return [
+        (k, v) for k, v in parse_qsl(query_string, keep_blank_values=True) if k != "key"
+    ]
+
+
+_ERROR_BODY_KEYS_EXHAUSTED = (
+    b'{"error": {"code": 503, "message": '
+    b'"All API keys exhausted", "status": "UNAVAILABLE"}}'
+)
+_ERROR_BODY_UNAVAILABLE = (
+    b'{"error": {"code": 503, "message": '
+    b'"Service temporarily unavailable", "status": "UNAVAILABLE"}}'
+)
+_RETRY_AFTER_HEADERS = {"Retry-After": "60"}
+
+
+def _service_unavailable(body: bytes) -> Response:
+    """Build a 503 response from one of the pre-encoded error bodies."""
+    return Response(
+        content=body,
+        status_code=503,
+        media_type="application/json",
+        headers=_RETRY_AFTER_HEADERS,
+    )
 
 
 class KeyManager(Protocol):
@@ -71,8 +104,8 @@ async def proxy_request(
        a. select_key() from key_manager
        b. If no key available -> return 503
        c. Inject x-goog-api-key header
-       d. Forward request via httpx
-       e. record_request() on key_manager
+       d. Forward request via httpx, streaming the response body
+       e. record_request() on key_manager once the body has been relayed
        f. If response is 429:
           - Parse error to determine if RPD or RPM limit
           - record_error() on key_manager
@@ -86,11 +119,12 @@ async def proxy_request(
     path = path_param if path_param is not None else ""
 
     body = await request.body()
-    headers = _prepare_headers(dict(request.headers))
-    query_string = _strip_key_from_query(request.url.query)
-    query_params: List[Tuple[str, str]] = parse_qsl(
-        query_string, keep_blank_values=True
-    )
+    headers = _prepare_headers(request.headers)
+    query_params = _query_params_without_key(request.url.query)
+    # Loop-invariant across retries; httpx does not mutate the params tuple.
+    params = tuple(query_params)
+    is_streaming = any(k == "alt" and v == "sse" for k, v in query_params)
+    timeout = _STREAMING_TIMEOUT if is_streaming else httpx.USE_CLIENT_DEFAULT
     reuse_key = None
 
     for attempt in range(config.max_retries):
@@ -101,47 +135,31 @@ async def proxy_request(
             selected_key = await key_manager.select_key()
 
         if selected_key is None:
-            return Response(
-                content=(
-                    '{"error": {"code": 503, "message": '
-                    '"All API keys exhausted", "status": "UNAVAILABLE"}}'
-                ),
-                status_code=503,
-                media_type="application/json",
-                headers={"Retry-After": "60"},
-            )
-
-        forward_headers = {**headers, "x-goog-api-key": selected_key.key}
+            return _service_unavailable(_ERROR_BODY_KEYS_EXHAUSTED)
 
-        is_streaming = dict(query_params).get("alt") == "sse"
+        forward_headers = headers + list(selected_key.auth_headers)
 
         try:
-            if is_streaming:
-                result = await _try_streaming_request(
-                    config,
-                    path,
-                    request.method,
-                    forward_headers,
-                    body,
-                    query_params,
-                    key_manager,
-                    selected_key,
-                )
-                if isinstance(result, StreamingResponse):
-                    return result
-                response = result
-            else:
-                response = await http_client.request(
+            response = await http_client.send(
+                http_client.build_request(
                     method=request.method,
                     url=f"/{path}",
                     content=body,
                     headers=forward_headers,
-                    params=tuple(query_params),
-                )
-
-            await key_manager.record_request(selected_key.id)
+                    params=params,
+                    timeout=timeout,
+                ),
+                stream=True,
+            )
 
             if response.status_code == 429:
+                # Only error bodies are buffered; they are needed to tell
+                # RPD from RPM limits.
+                try:
+                    await response.aread()
+                finally:
+                    await response.aclose()
+                await key_manager.record_request(selected_key.id)
                 is_rpd = _is_rpd_limit(response)
                 await key_manager.record_error(selected_key.id, is_rpd_limit=is_rpd)
                 logger.warning(
@@ -155,17 +173,28 @@ async def proxy_request(
                     reuse_key = selected_key
                 continue
 
+            if is_streaming and response.status_code == 200:
+                return StreamingResponse(
+                    _relay_body(response, key_manager, selected_key),
+                    status_code=200,
+                    media_type="text/event-stream",
+                    background=BackgroundTask(response.aclose),
+                )
+
             resp_headers = {
                 k: v
                 for k, v in response.headers.items()
                 if k.lower() not in HOP_BY_HOP_HEADERS
             }
             media_type = cast(Optional[str], response.headers.get("content-type"))
-            return Response(
-                content=response.content,
+            return StreamingResponse(
+                _relay_body(response, key_manager, selected_key),
                 status_code=response.status_code,
                 headers=resp_headers,
                 media_type=media_type,
+                # The generator's finally never runs if the client leaves
+                # before streaming starts; this releases the connection anyway.
+                background=BackgroundTask(response.aclose),
             )
 
         except httpx.TimeoutException:
@@ -179,102 +208,39 @@ async def proxy_request(
             await key_manager.record_error(selected_key.id)
             continue
 
-    return Response(
-        content=(
-            '{"error": {"code": 503, "message": '
-            '"Service temporarily unavailable", "status": "UNAVAILABLE"}}'
-        ),
-        status_code=503,
-        media_type="application/json",
-        headers={"Retry-After": "60"},
-    )
+    return _service_unavailable(_ERROR_BODY_UNAVAILABLE)
 
 
 def _is_rpd_limit(response: httpx.Response) -> bool:
     """Determine if a 429 response is due to RPD (daily) or RPM (per-minute) limit."""
+    # A substring scan of the raw body is enough to spot the daily-quota
+    # wording and avoids parsing JSON on every rate-limited attempt.
     try:
-        data = cast(Dict[str, object], response.json())
-        error_obj = data.get("error", {})
-        if isinstance(error_obj, dict):
-            error_dict = cast(Dict[str, object], error_obj)
-        else:
-            error_dict = {}
-        message = error_dict.get("message", "")
-        error_message = str(message).lower()
-        if "per day" in error_message or "daily" in error_message:
-            return True
-        return False
-    except Exception:
+        body = response.content.lower()
+    except httpx.ResponseNotRead:
         return False
+    return b"per day" in body or b"daily" in body
 
 
-async def _try_streaming_request(
-    config: Config,
-    path: str,
-    method: str,
-    headers: Dict[str, str],
-    body: bytes,
-    query_params: List[Tuple[str, str]],
-    key_manager: KeyManager,
-    selected_key: ApiKey,
-) -> Union[StreamingResponse, httpx.Response]:
-    streaming_client = httpx.AsyncClient(
-        base_url=config.gemini_base_url,
-        timeout=httpx.Timeout(10.0, read=None),
-    )
-    try:
-        response = await streaming_client.send(
-            streaming_client.build_request(
-                method=method,
-                url=f"/{path}",
-                content=body,
-                headers=headers,
-                params=tuple(query_params),
-            ),
-            stream=True,
-        )
-
-        if response.status_code == 429:
-            error_body = await response.aread()
-            await response.aclose()
-            await streaming_client.aclose()
-            return httpx.Response(
-                status_code=429,
-                content=error_body,
-                headers=dict(response.headers),
-            )
+async def _relay_body(
+    response: httpx.Response, key_manager: KeyManager, key: ApiKey
+) -> AsyncIterator[bytes]:
+    """Yield the upstream body as it arrives, closing the response afterwards.
 
-        if response.status_code != 200:
-            error_body = await response.aread()
-            await response.aclose()
-            await streaming_client.aclose()
-            resp_headers = {
-                k: v
-                for k, v in response.headers.items()
-                if k.lower() not in HOP_BY_HOP_HEADERS
-            }
-            return StreamingResponse(
-                content=iter([error_body]),
-                status_code=response.status_code,
-                headers=resp_headers,
-                media_type=response.headers.get("content-type"),
-            )
-
-        async def stream_generator():
-            try:
-                async for chunk in response.aiter_bytes():
-                    if chunk:
-                        yield chunk
-                await key_manager.record_request(selected_key.id)
-            finally:
-                await response.aclose()
-                await streaming_client.aclose()
-
-        return StreamingResponse(
-            stream_generator(),
-            status_code=200,
-            media_type="text/event-stream",
-        )
-    except Exception:
-        await streaming_client.aclose()
+    Usage is recorded only once the whole body has been relayed. An upstream
+    failure after the headers cannot be retried, since the status line is
+    already sent; the key is penalised and the error re-raised so the server
+    aborts the reply instead of ending a truncated body cleanly.
+    """
+    try:
+        async for chunk in response.aiter_bytes():
+            if chunk:
+                yield chunk
+    except httpx.HTTPError as exc:
+        logger.error("Upstream failed mid-body (key=%s): %r", key.key_prefix(), exc)
+        await key_manager.record_error(key.id)
         raise
+    else:
+        await key_manager.record_request(key.id)
+    finally:
+        await response.aclose()
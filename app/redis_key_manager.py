@@ -0,0 +1,153 @@
+"""Redis-backed key pool state shared across uvicorn workers."""
+
+import hashlib
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis
+
+from app.config import Config
+from app.key_manager import KeyManager
+from app.models import ApiKey, STATUS_ACTIVE, STATUS_EXHAUSTED
+
+# Counters are namespaced by Pacific date, so yesterday's keys simply stop
+# being read at rollover; the TTL only reclaims the memory.
+_COUNTER_TTL_SECONDS = 2 * 24 * 60 * 60
+_RPM_WINDOW_SECONDS = 60
+
+
+class RedisKeyManager(KeyManager):
+    """KeyManager whose usage counters live in Redis.
+
+    Every worker builds the same ApiKey objects from config, but rpd_used,
+    status, consecutive_failures and the RPM window are read from and
+    written to Redis, so quota consumed by one worker is visible to all.
+    Counters are keyed by a digest of the secret rather than the pool id,
+    so ids that differ between workers (reordered GEMINI_API_KEYS, keys
+    added via /admin) still map to the right quota. last_used/last_error
+    and the set of keys added via /admin stay per-worker.
+    """
+
+    def __init__(self, config: Config, redis: Redis, prefix: str = "gemini-proxy"):
+        super().__init__(config)
+        self._redis = redis
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, config: Config, url: str) -> "RedisKeyManager":
+        return cls(config, Redis.from_url(url))
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        await self._redis.aclose()
+
+    async def select_key(self) -> Optional[ApiKey]:
+        await self.check_and_reset_daily()
+        await self._sync_from_redis()
+        return self._pick_key()
+
+    async def select_keys(self, count: int) -> List[ApiKey]:
+        await self.check_and_reset_daily()
+        await self._sync_from_redis()
+        return self._pick_keys(count)
+
+    async def get_status(self) -> Dict[str, object]:
+        await self.check_and_reset_daily()
+        await self._sync_from_redis()
+        return await super().get_status()
+
+    async def get_key_status(self, key_id: str) -> Optional[Dict[str, object]]:
+        await self.check_and_reset_daily()
+        await self._sync_from_redis()
+        return await super().get_key_status(key_id)
+
+    async def record_request(self, key_id: str) -> None:
+        await self.record_requests_batch(key_id, 1)
+
+    async def record_requests_batch(self, key_id: str, count: int) -> None:
+        key = self.pool.keys.get(key_id)
+        if not key or count <= 0:
+            return
+
+        now = time.time()
+        counter_key = self._counter_key(key)
+        rpm_key = self._rpm_key(key)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hincrby(counter_key, "rpd_used", count)
+        # Members must be unique across workers; the score carries the time.
+        pipe.zadd(rpm_key, {f"{now}:{uuid.uuid4().hex}": now for _ in range(count)})
+        pipe.zremrangebyscore(rpm_key, "-inf", now - _RPM_WINDOW_SECONDS)
+        pipe.expire(counter_key, _COUNTER_TTL_SECONDS)
+        pipe.expire(rpm_key, _COUNTER_TTL_SECONDS)
+        results = await pipe.execute()
+
+        async with self._key_lock(key_id):
+            self._apply_request(key, now, count)
+            key.rpd_used = int(results[0])
+            if key.rpd_used >= key.rpd_limit:
+                key.status = STATUS_EXHAUSTED
+                await self._redis.hset(counter_key, "status", STATUS_EXHAUSTED)
+
+    async def record_error(self, key_id: str, is_rpd_limit: bool = False) -> None:
+        key = self.pool.keys.get(key_id)
+        if not key:
+            return
+
+        counter_key = self._counter_key(key)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hincrby(counter_key, "consecutive_failures", 1)
+        if is_rpd_limit:
+            pipe.hset(counter_key, "status", STATUS_EXHAUSTED)
+        pipe.expire(counter_key, _COUNTER_TTL_SECONDS)
+        await pipe.execute()
+
+        await super().record_error(key_id, is_rpd_limit=is_rpd_limit)
+
+    async def force_reset(self) -> None:
+        keys = list(self.pool.keys.values())
+        if keys:
+            await self._redis.delete(
+                *[self._counter_key(key) for key in keys],
+                *[self._rpm_key(key) for key in keys],
+            )
+        await super().force_reset()
+
+    async def _sync_from_redis(self) -> None:
+        """Refresh local counters for every key from one pipelined round-trip."""
+        keys = list(self.pool.keys.values())
+        if not keys:
+            return
+
+        cutoff = time.time() - _RPM_WINDOW_SECONDS
+        pipe = self._redis.pipeline(transaction=False)
+        for key in keys:
+            rpm_key = self._rpm_key(key)
+            pipe.hmget(
+                self._counter_key(key),
+                "rpd_used",
+                "status",
+                "consecutive_failures",
+            )
+            pipe.zremrangebyscore(rpm_key, "-inf", cutoff)
+            pipe.zrange(rpm_key, 0, -1, withscores=True)
+        results = await pipe.execute()
+
+        for index, key in enumerate(keys):
+            rpd_used, status, failures = results[index * 3]
+            window = results[index * 3 + 2]
+            key.rpd_used = int(rpd_used or 0)
+            if isinstance(status, bytes):
+                status = status.decode()
+            key.status = status or STATUS_ACTIVE
+            key.consecutive_failures = int(failures or 0)
+            key.rpm_timestamps = deque(score for _, score in window)
+
+    def _counter_key(self, key: ApiKey) -> str:
+        # Never the raw secret: Redis keys show up in MONITOR and SCAN output.
+        digest = hashlib.sha256(key.key.encode()).hexdigest()[:16]
+        return f"{self._prefix}:{self.pool.last_reset_date}:{digest}"
+
+    def _rpm_key(self, key: ApiKey) -> str:
+        return f"{self._counter_key(key)}:rpm"
@@ -0,0 +1,13 @@
+"""Response classes shared across routers."""
+
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, which encodes datetimes natively."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
@@ -4,16 +4,18 @@ Provides key allocation/release API so SDK clients can borrow real API keys
 from the pool, use them directly with the SDK, and report usage back.
 """
 
+from collections import Counter
 from typing import Dict
 
 from fastapi import APIRouter, Request, HTTPException
-from starlette.responses import JSONResponse
+
+from app.responses import ORJSONResponse
 
 sdk_router = APIRouter(prefix="/sdk", tags=["sdk"])
 
 
 @sdk_router.post("/allocate-key")
-async def allocate_key(request: Request) -> JSONResponse:
+async def allocate_key(request: Request) -> ORJSONResponse:
     """Allocate an available API key from the pool.
 
     Returns the real API key for direct SDK use.
@@ -30,7 +32,7 @@ async def allocate_key(request: Request) -> JSONResponse:
             headers={"Retry-After": "60"},
         )
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={
             "key_id": selected_key.id,
             "api_key": selected_key.key,
@@ -38,6 +40,39 @@ async def allocate_key(request: Request) -> JSONResponse:
     )
 
 
+@sdk_router.post("/allocate-keys")
+async def allocate_keys(request: Request) -> ORJSONResponse:
+    """Allocate several distinct API keys in one round-trip.
+
+    Body: {"count": 3}
+
+    Returns up to ``count`` keys, best first. Usage for each call made with
+    them should be reported via /sdk/report-usage or /sdk/report-usage-batch.
+    """
+    key_manager = request.app.state.key_manager
+    body = await request.json()
+    count = body.get("count", 1)
+
+    # type() rather than isinstance(): JSON true must not pass as count=1.
+    if type(count) is not int or count <= 0:
+        raise HTTPException(status_code=400, detail="count must be a positive integer")
+
+    selected_keys = await key_manager.select_keys(count)
+
+    if not selected_keys:
+        raise HTTPException(
+            status_code=503,
+            detail="All API keys exhausted",
+            headers={"Retry-After": "60"},
+        )
+
+    return ORJSONResponse(
+        content={
+            "keys": [{"key_id": key.id, "api_key": key.key} for key in selected_keys]
+        }
+    )
+
+
 @sdk_router.post("/report-usage")
 async def report_usage(request: Request) -> Dict[str, str]:
     """Report successful API usage for a previously allocated key.
@@ -58,6 +93,30 @@ async def report_usage(request: Request) -> Dict[str, str]:
     return {"status": "recorded"}
 
 
+@sdk_router.post("/report-usage-batch")
+async def report_usage_batch(request: Request) -> Dict[str, str]:
+    """Report several successful API calls at once.
+
+    Body: {"key_ids": ["key_1", "key_2", "key_1"]}
+
+    A key_id appears once per call made with it.
+    """
+    key_manager = request.app.state.key_manager
+    body = await request.json()
+    key_ids = body.get("key_ids")
+
+    if not isinstance(key_ids, list) or not key_ids:
+        raise HTTPException(status_code=400, detail="key_ids is required")
+
+    missing = [key_id for key_id in key_ids if key_id not in key_manager.pool.keys]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Key {missing[0]} not found")
+
+    for key_id, count in Counter(key_ids).items():
+        await key_manager.record_requests_batch(key_id, count)
+    return {"status": "recorded"}
+
+
 @sdk_router.post("/report-error")
 async def report_error(request: Request) -> Dict[str, str]:
     """Report an API error for a previously allocated key.
@@ -0,0 +1,102 @@
+import os
+from typing import Callable, Optional
+
+import httpx
+import pytest
+
+from app.config import load_config
+from app.key_manager import KeyManager
+from app.main import app as main_app
+
+# Set once for the whole session instead of per test; tests that need other
+# keys override it locally with monkeypatch.
+os.environ["GEMINI_API_KEYS"] = "test_key_1,test_key_2,test_key_3"
+
+
+@pytest.fixture(scope="session")
+def base_config():
+    """Load the test configuration once; it is immutable and shared."""
+    return load_config(use_dotenv=False)
+
+
+@pytest.fixture(scope="session")
+async def http_client():
+    """Outbound client for app-level tests; respx intercepts its transport."""
+    async with httpx.AsyncClient(
+        base_url="https://generativelanguage.googleapis.com"
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+def app(base_config, http_client):
+    """Install test state on the app with a fresh key pool per test."""
+    main_app.state.config = base_config
+    main_app.state.http_client = http_client
+    main_app.state.key_manager = KeyManager(base_config)
+
+    yield main_app
+
+    if hasattr(main_app.state, "config"):
+        del main_app.state.config
+    if hasattr(main_app.state, "http_client"):
+        del main_app.state.http_client
+    if hasattr(main_app.state, "key_manager"):
+        del main_app.state.key_manager
+
+
+class CannedTransport(httpx.AsyncBaseTransport):
+    """Answer every outbound request with the same successful Gemini reply."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]}
+        )
+
+
+@pytest.fixture(scope="session")
+async def canned_http_client():
+    """Outbound client that bypasses respx routing for tests needing only 200s."""
+    async with httpx.AsyncClient(
+        transport=CannedTransport(),
+        base_url="https://generativelanguage.googleapis.com",
+    ) as client:
+        yield client
+
+
+class UpstreamStub:
+    """MockTransport handler behind upstream_client; each test sets ``handler``."""
+
+    __slots__ = ("handler",)
+
+    def __init__(self) -> None:
+        self.handler: Optional[Callable[[httpx.Request], httpx.Response]] = None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if self.handler is None:
+            raise AssertionError(f"unexpected upstream request: {request.url}")
+        return self.handler(request)
+
+
+@pytest.fixture(scope="session")
+def upstream_stub():
+    return UpstreamStub()
+
+
+@pytest.fixture(scope="session")
+async def upstream_client(upstream_stub):
+    """Outbound client shared by proxy unit tests, answered by upstream_stub.
+
+    The base URL matches make_config() in test_proxy.py.
+    """
+    async with httpx.AsyncClient(
+        base_url="https://gemini.example.test",
+        transport=httpx.MockTransport(upstream_stub),
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+def upstream(upstream_stub):
+    yield upstream_stub
+    upstream_stub.handler = None
@@ -1,35 +1,6 @@
-import os
-import pytest
-import httpx
-from fastapi.testclient import TestClient
-from app.main import app as main_app
-from app.config import load_config
-from app.key_manager import KeyManager
-
-
-@pytest.fixture(autouse=True)
-def set_env(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", "test_key_1,test_key_2")
-
+from datetime import datetime, timezone
 
-@pytest.fixture
-def app():
-    config = load_config(use_dotenv=False)
-    http_client = httpx.AsyncClient(base_url=config.gemini_base_url)
-    key_manager = KeyManager(config)
-
-    main_app.state.config = config
-    main_app.state.http_client = http_client
-    main_app.state.key_manager = key_manager
-
-    yield main_app
-
-    if hasattr(main_app.state, "config"):
-        del main_app.state.config
-    if hasattr(main_app.state, "http_client"):
-        del main_app.state.http_client
-    if hasattr(main_app.state, "key_manager"):
-        del main_app.state.key_manager
+from fastapi.testclient import TestClient
 
 
 def test_get_all_status(app):
@@ -41,7 +12,19 @@ def test_get_all_status(app):
     assert "available_keys" in data
     assert "keys" in data
     assert isinstance(data["keys"], list)
-    assert len(data["keys"]) == 2
+    assert len(data["keys"]) == 3
+
+
+def test_get_all_status_serializes_datetimes(app):
+    last_used = datetime(2026, 2, 14, 10, 0, 0, tzinfo=timezone.utc)
+    app.state.key_manager.pool.keys["key_1"].last_used = last_used
+
+    client = TestClient(app)
+    response = client.get("/admin/status")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["keys"][0]["last_used"] == last_used.isoformat()
+    assert data["keys"][0]["last_error"] is None
 
 
 def test_get_key_status(app):
@@ -85,7 +68,7 @@ def test_add_key(app):
     assert response.status_code == 201
     data = response.json()
     assert "key_id" in data
-    assert data["key_id"] == "key_3"
+    assert data["key_id"] == "key_4"
 
 
 def test_add_key_missing_api_key(app):
@@ -1,72 +1,120 @@
+import dataclasses
 import os
 import pytest
 from app.config import Config, load_config
 
-
-def test_config_loads_valid_env(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", "key1,key2")
+CONFIG_ENV_VARS = (
+    "GEMINI_API_KEYS",
+    "PORT",
+    "HOST",
+    "DEFAULT_RPD_LIMIT",
+    "DEFAULT_RPM_LIMIT",
+    "MAX_RETRIES",
+    "RETRY_DELAY_SECONDS",
+    "GEMINI_BASE_URL",
+    "LOG_LEVEL",
+    "REDIS_URL",
+)
+
+DEFAULTS = {
+    "port": 8000,
+    "host": "0.0.0.0",
+    "default_rpd_limit": 250,
+    "default_rpm_limit": 10,
+    "max_retries": 3,
+    "retry_delay_seconds": 2,
+    "gemini_base_url": "https://generativelanguage.googleapis.com",
+    "log_level": "INFO",
+    "redis_url": None,
+}
+
+MISSING_KEYS_ERROR = "GEMINI_API_KEYS environment variable must be set and non-empty"
+
+CASES = [
+    pytest.param(
+        {"env": {"GEMINI_API_KEYS": "key1,key2"}, "expected": {}},
+        id="defaults",
+    ),
+    pytest.param(
+        {"env": {}, "raises": ValueError},
+        id="missing_api_keys",
+    ),
+    pytest.param(
+        {"env": {"GEMINI_API_KEYS": ""}, "raises": ValueError},
+        id="empty_api_keys",
+    ),
+    pytest.param(
+        {
+            "env": {
+                "GEMINI_API_KEYS": "custom_key",
+                "PORT": "9000",
+                "HOST": "127.0.0.1",
+                "DEFAULT_RPD_LIMIT": "500",
+                "DEFAULT_RPM_LIMIT": "20",
+                "MAX_RETRIES": "5",
+                "RETRY_DELAY_SECONDS": "3",
+                "GEMINI_BASE_URL": "https://custom.api.com",
+                "LOG_LEVEL": "DEBUG",
+                "REDIS_URL": "redis://localhost:6379/0",
+            },
+            "expected": {
+                "api_keys": ("custom_key",),
+                "port": 9000,
+                "host": "127.0.0.1",
+                "default_rpd_limit": 500,
+                "default_rpm_limit": 20,
+                "max_retries": 5,
+                "retry_delay_seconds": 3,
+                "gemini_base_url": "https://custom.api.com",
+                "log_level": "DEBUG",
+                "redis_url": "redis://localhost:6379/0",
+            },
+        },
+        id="custom_values",
+    ),
+    pytest.param(
+        {"env": {"GEMINI_API_KEYS": " key1 , key2 "}, "expected": {}},
+        id="strips_whitespace",
+    ),
+]
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_config(monkeypatch, case):
+    for name in CONFIG_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    for name, value in case["env"].items():
+        monkeypatch.setenv(name, value)
+
+    if "raises" in case:
+        with pytest.raises(case["raises"], match=MISSING_KEYS_ERROR):
+            load_config(use_dotenv=False)
+        return
 
     config = load_config(use_dotenv=False)
 
-    assert config.api_keys == ["key1", "key2"]
-    assert config.port == 8000
-    assert config.host == "0.0.0.0"
-    assert config.default_rpd_limit == 250
-    assert config.default_rpm_limit == 10
-    assert config.max_retries == 3
-    assert config.retry_delay_seconds == 2
-    assert config.gemini_base_url == "https://generativelanguage.googleapis.com"
-    assert config.log_level == "INFO"
-
-
-def test_config_missing_api_keys(monkeypatch):
-    monkeypatch.delenv("GEMINI_API_KEYS", raising=False)
-    monkeypatch.setattr("app.config.load_dotenv", lambda: None)
-
-    with pytest.raises(
-        ValueError,
-        match="GEMINI_API_KEYS environment variable must be set and non-empty",
-    ):
-        load_config(use_dotenv=False)
-
-
-def test_config_empty_api_keys(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", "")
-
-    with pytest.raises(
-        ValueError,
-        match="GEMINI_API_KEYS environment variable must be set and non-empty",
-    ):
-        load_config(use_dotenv=False)
-
-
-def test_config_custom_values(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", "custom_key")
-    monkeypatch.setenv("PORT", "9000")
-    monkeypatch.setenv("HOST", "127.0.0.1")
-    monkeypatch.setenv("DEFAULT_RPD_LIMIT", "500")
-    monkeypatch.setenv("DEFAULT_RPM_LIMIT", "20")
-    monkeypatch.setenv("MAX_RETRIES", "5")
-    monkeypatch.setenv("RETRY_DELAY_SECONDS", "3")
-    monkeypatch.setenv("GEMINI_BASE_URL", "https://custom.api.com")
-    monkeypatch.setenv("LOG_LEVEL", "DEBUG")
+    expected = {"api_keys": ("key1", "key2"), **DEFAULTS, **case["expected"]}
+    for field_name, value in expected.items():
+        assert getattr(config, field_name) == value
+
+
+def test_config_is_immutable(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", "key1")
 
     config = load_config(use_dotenv=False)
 
-    assert config.api_keys == ["custom_key"]
-    assert config.port == 9000
-    assert config.host == "127.0.0.1"
-    assert config.default_rpd_limit == 500
-    assert config.default_rpm_limit == 20
-    assert config.max_retries == 5
-    assert config.retry_delay_seconds == 3
-    assert config.gemini_base_url == "https://custom.api.com"
-    assert config.log_level == "DEBUG"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.max_retries = 10  # type: ignore[misc]
 
 
-def test_config_strips_whitespace(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", " key1 , key2 ")
+def test_config_cached_until_env_changes(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", "key1")
 
-    config = load_config(use_dotenv=False)
+    first = load_config(use_dotenv=False)
+    assert load_config(use_dotenv=False) is first
+
+    monkeypatch.setenv("GEMINI_API_KEYS", "key2")
+    second = load_config(use_dotenv=False)
 
-    assert config.api_keys == ["key1", "key2"]
+    assert second is not first
+    assert second.api_keys == ("key2",)
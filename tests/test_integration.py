@@ -2,125 +2,110 @@
 
 import asyncio
 import pytest
-import httpx
 import respx
 from httpx import AsyncClient, ASGITransport, Response
-from app.main import app as main_app
-from app.config import load_config
-from app.key_manager import KeyManager
 
+# Serialized once and reused by reference for every proxied request.
+TEST_BODY = b'{"contents":[{"parts":[{"text":"Test"}]}]}'
+TEST_HEADERS = {"content-type": "application/json"}
 
-@pytest.fixture
-async def app(monkeypatch):
-    """Set up app with test configuration."""
-    monkeypatch.setenv("GEMINI_API_KEYS", "test_key_1,test_key_2,test_key_3")
-
-    config = load_config(use_dotenv=False)
-    http_client = httpx.AsyncClient(base_url=config.gemini_base_url)
-    key_manager = KeyManager(config)
 
-    main_app.state.config = config
-    main_app.state.http_client = http_client
-    main_app.state.key_manager = key_manager
+@pytest.fixture(autouse=True)
+def respx_router():
+    """Patch httpx once per test; tests register only the routes they need."""
+    with respx.mock(assert_all_called=False) as router:
+        yield router
 
-    yield main_app
 
-    await http_client.aclose()
-
-    if hasattr(main_app.state, "config"):
-        del main_app.state.config
-    if hasattr(main_app.state, "http_client"):
-        del main_app.state.http_client
-    if hasattr(main_app.state, "key_manager"):
-        del main_app.state.key_manager
+@pytest.fixture
+def canned_app(app, canned_http_client):
+    app.state.http_client = canned_http_client
+    return app
 
 
 @pytest.mark.asyncio
-async def test_complete_proxy_flow(app):
+async def test_complete_proxy_flow(app, respx_router):
     """Test complete proxy flow: request -> key selection -> Gemini (mocked) -> response."""
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            gemini_mock = respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "Hello!"}]}}]},
-                    headers={"content-type": "application/json"},
-                )
+        gemini_mock = respx_router.post(
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        ).mock(
+            return_value=Response(
+                200,
+                json={"candidates": [{"content": {"parts": [{"text": "Hello!"}]}}]},
+                headers={"content-type": "application/json"},
             )
+        )
 
-            response = await client.post(
-                "/v1beta/models/gemini-pro:generateContent",
-                json={"contents": [{"parts": [{"text": "Hello"}]}]},
-            )
+        response = await client.post(
+            "/v1beta/models/gemini-pro:generateContent",
+            json={"contents": [{"parts": [{"text": "Hello"}]}]},
+        )
 
-            assert response.status_code == 200
-            data = response.json()
-            assert "candidates" in data
-            assert data["candidates"][0]["content"]["parts"][0]["text"] == "Hello!"
-            assert gemini_mock.called
-
-            # Verify key was injected
-            request = gemini_mock.calls[0].request
-            assert "x-goog-api-key" in request.headers
-            assert request.headers["x-goog-api-key"] in [
-                "test_key_1",
-                "test_key_2",
-                "test_key_3",
-            ]
+        assert response.status_code == 200
+        data = response.json()
+        assert "candidates" in data
+        assert data["candidates"][0]["content"]["parts"][0]["text"] == "Hello!"
+        assert gemini_mock.called
+
+        # Verify key was injected
+        request = gemini_mock.calls[0].request
+        assert "x-goog-api-key" in request.headers
+        assert request.headers["x-goog-api-key"] in [
+            "test_key_1",
+            "test_key_2",
+            "test_key_3",
+        ]
 
 
 @pytest.mark.asyncio
-async def test_429_retry_switches_keys(app):
+async def test_429_retry_switches_keys(app, respx_router):
     """Test that 429 RPD error triggers key switch and retry."""
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            # First call returns 429 with RPD error
-            first_mock = respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                side_effect=[
-                    Response(
-                        429,
-                        json={
-                            "error": {
-                                "code": 429,
-                                "message": "Resource exhausted: quota exceeded per day",
-                            }
-                        },
-                    ),
-                    Response(
-                        200,
-                        json={
-                            "candidates": [
-                                {"content": {"parts": [{"text": "Success!"}]}}
-                            ]
-                        },
-                    ),
-                ]
-            )
+        # First call returns 429 with RPD error
+        first_mock = respx_router.post(
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        ).mock(
+            side_effect=[
+                Response(
+                    429,
+                    json={
+                        "error": {
+                            "code": 429,
+                            "message": "Resource exhausted: quota exceeded per day",
+                        }
+                    },
+                ),
+                Response(
+                    200,
+                    json={
+                        "candidates": [{"content": {"parts": [{"text": "Success!"}]}}]
+                    },
+                ),
+            ]
+        )
 
-            response = await client.post(
-                "/v1beta/models/gemini-pro:generateContent",
-                json={"contents": [{"parts": [{"text": "Test"}]}]},
-            )
+        response = await client.post(
+            "/v1beta/models/gemini-pro:generateContent",
+            content=TEST_BODY,
+            headers=TEST_HEADERS,
+        )
 
-            assert response.status_code == 200
-            assert first_mock.call_count == 2
+        assert response.status_code == 200
+        assert first_mock.call_count == 2
 
-            # Verify different keys were used
-            first_key = first_mock.calls[0].request.headers["x-goog-api-key"]
-            second_key = first_mock.calls[1].request.headers["x-goog-api-key"]
-            assert first_key != second_key
+        # Verify different keys were used
+        first_key = first_mock.calls[0].request.headers["x-goog-api-key"]
+        second_key = first_mock.calls[1].request.headers["x-goog-api-key"]
+        assert first_key != second_key
 
 
 @pytest.mark.asyncio
-async def test_rpd_exhaustion_marks_key(app):
+async def test_rpd_exhaustion_marks_key(app, respx_router):
     """Test that reaching RPD limit marks key as exhausted."""
     key_manager = app.state.key_manager
 
@@ -129,42 +114,44 @@ async def test_rpd_exhaustion_marks_key(app):
         key.rpd_used = key.rpd_limit
         key.status = "exhausted"
 
+    # One request short of the limit, so a single call crosses it.
     key_manager.pool.keys["key_1"].rpd_limit = 2
+    key_manager.pool.keys["key_1"].rpd_used = 1
 
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
-                )
+        respx_router.post(
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        ).mock(
+            return_value=Response(
+                200,
+                json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
             )
+        )
 
-            for _ in range(2):
-                response = await client.post(
-                    "/v1beta/models/gemini-pro:generateContent",
-                    json={"contents": [{"parts": [{"text": "Test"}]}]},
-                )
-                assert response.status_code == 200
+        response = await client.post(
+            "/v1beta/models/gemini-pro:generateContent",
+            content=TEST_BODY,
+            headers=TEST_HEADERS,
+        )
+        assert response.status_code == 200
 
-            status = await key_manager.get_status()
-            key_1_status = next(k for k in status["keys"] if k["id"] == "key_1")
-            assert key_1_status["status"] == "exhausted"
-            assert key_1_status["rpd_used"] == 2
+        status = await key_manager.get_status()
+        key_1_status = next(k for k in status["keys"] if k["id"] == "key_1")
+        assert key_1_status["status"] == "exhausted"
+        assert key_1_status["rpd_used"] == 2
 
-            response = await client.post(
-                "/v1beta/models/gemini-pro:generateContent",
-                json={"contents": [{"parts": [{"text": "Test"}]}]},
-            )
-            assert response.status_code == 503
+        response = await client.post(
+            "/v1beta/models/gemini-pro:generateContent",
+            content=TEST_BODY,
+            headers=TEST_HEADERS,
+        )
+        assert response.status_code == 503
 
 
 @pytest.mark.asyncio
-async def test_rpm_limit_enforcement(app):
+async def test_rpm_limit_enforcement(app, respx_router):
     """Test that RPM limit is enforced (key skipped when at limit)."""
     key_manager = app.state.key_manager
 
@@ -175,118 +162,109 @@ async def test_rpm_limit_enforcement(app):
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            mock_route = respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
-                )
+        mock_route = respx_router.post(
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        ).mock(
+            return_value=Response(
+                200,
+                json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
             )
+        )
 
-            # Send 5 requests rapidly
-            for _ in range(5):
-                response = await client.post(
-                    "/v1beta/models/gemini-pro:generateContent",
-                    json={"contents": [{"parts": [{"text": "Test"}]}]},
-                )
-                assert response.status_code == 200
+        # Send 5 requests rapidly
+        for _ in range(5):
+            response = await client.post(
+                "/v1beta/models/gemini-pro:generateContent",
+                content=TEST_BODY,
+                headers=TEST_HEADERS,
+            )
+            assert response.status_code == 200
 
-            # Verify multiple keys were used (due to RPM limits)
-            used_keys = set()
-            for call in mock_route.calls:
-                used_keys.add(call.request.headers["x-goog-api-key"])
+        # Verify multiple keys were used (due to RPM limits)
+        used_keys = set()
+        for call in mock_route.calls:
+            used_keys.add(call.request.headers["x-goog-api-key"])
 
-            # With 3 keys and RPM limit of 2, we should use at least 2 keys
-            assert len(used_keys) >= 2
+        # With 3 keys and RPM limit of 2, we should use at least 2 keys
+        assert len(used_keys) >= 2
 
 
 @pytest.mark.asyncio
-async def test_admin_status_reflects_usage(app):
+async def test_admin_status_reflects_usage(canned_app):
     """Test that admin status endpoint reflects proxy request usage."""
     async with AsyncClient(
-        transport=ASGITransport(app=app), base_url="http://test"
+        transport=ASGITransport(app=canned_app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
-                )
+        # Get initial status
+        status_response = await client.get("/admin/status")
+        assert status_response.status_code == 200
+        initial_status = status_response.json()
+        initial_total_used = sum(k["rpd_used"] for k in initial_status["keys"])
+
+        # Send 3 proxy requests
+        for _ in range(3):
+            response = await client.post(
+                "/v1beta/models/gemini-pro:generateContent",
+                content=TEST_BODY,
+                headers=TEST_HEADERS,
             )
+            assert response.status_code == 200
 
-            # Get initial status
-            status_response = await client.get("/admin/status")
-            assert status_response.status_code == 200
-            initial_status = status_response.json()
-            initial_total_used = sum(k["rpd_used"] for k in initial_status["keys"])
-
-            # Send 3 proxy requests
-            for _ in range(3):
-                response = await client.post(
-                    "/v1beta/models/gemini-pro:generateContent",
-                    json={"contents": [{"parts": [{"text": "Test"}]}]},
-                )
-                assert response.status_code == 200
-
-            # Check status again
-            status_response = await client.get("/admin/status")
-            assert status_response.status_code == 200
-            final_status = status_response.json()
-            final_total_used = sum(k["rpd_used"] for k in final_status["keys"])
+        # Check status again
+        status_response = await client.get("/admin/status")
+        assert status_response.status_code == 200
+        final_status = status_response.json()
+        final_total_used = sum(k["rpd_used"] for k in final_status["keys"])
 
-            # Total usage should have increased by 3
-            assert final_total_used == initial_total_used + 3
+        # Total usage should have increased by 3
+        assert final_total_used == initial_total_used + 3
 
 
 @pytest.mark.asyncio
-async def test_admin_add_then_use_key(app):
+async def test_admin_add_then_use_key(app, respx_router):
     """Test adding a key via admin API and then using it for proxy requests."""
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
-                )
+        respx_router.post(
+            "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+        ).mock(
+            return_value=Response(
+                200,
+                json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
             )
-
-            # Add a new key
-            add_response = await client.post(
-                "/admin/keys",
-                json={"api_key": "new_test_key_123", "rpd_limit": 300, "rpm_limit": 15},
-            )
-            assert add_response.status_code == 201
-            data = add_response.json()
-            new_key_id = data["key_id"]
-            assert new_key_id == "key_4"
-
-            # Exhaust existing keys to force use of new key
-            key_manager = app.state.key_manager
-            for key_id in ["key_1", "key_2", "key_3"]:
-                key = key_manager.pool.keys[key_id]
-                key.rpd_used = key.rpd_limit
-                key.status = "exhausted"
-
-            # Send proxy request - should use new key
-            response = await client.post(
-                "/v1beta/models/gemini-pro:generateContent",
-                json={"contents": [{"parts": [{"text": "Test"}]}]},
-            )
-            assert response.status_code == 200
-
-            # Verify new key was used
-            status_response = await client.get(f"/admin/status/{new_key_id}")
-            assert status_response.status_code == 200
-            key_status = status_response.json()
-            assert key_status["rpd_used"] == 1
+        )
+
+        # Add a new key
+        add_response = await client.post(
+            "/admin/keys",
+            json={"api_key": "new_test_key_123", "rpd_limit": 300, "rpm_limit": 15},
+        )
+        assert add_response.status_code == 201
+        data = add_response.json()
+        new_key_id = data["key_id"]
+        assert new_key_id == "key_4"
+
+        # Exhaust existing keys to force use of new key
+        key_manager = app.state.key_manager
+        for key_id in ["key_1", "key_2", "key_3"]:
+            key = key_manager.pool.keys[key_id]
+            key.rpd_used = key.rpd_limit
+            key.status = "exhausted"
+
+        # Send proxy request - should use new key
+        response = await client.post(
+            "/v1beta/models/gemini-pro:generateContent",
+            content=TEST_BODY,
+            headers=TEST_HEADERS,
+        )
+        assert response.status_code == 200
+
+        # Verify new key was used
+        status_response = await client.get(f"/admin/status/{new_key_id}")
+        assert status_response.status_code == 200
+        key_status = status_response.json()
+        assert key_status["rpd_used"] == 1
 
 
 @pytest.mark.asyncio
@@ -311,45 +289,36 @@ async def test_admin_remove_key(app):
 
 
 @pytest.mark.asyncio
-async def test_concurrent_requests_no_race(app):
+async def test_concurrent_requests_no_race(canned_app):
     """Test that concurrent requests don't cause race conditions in usage tracking."""
     async with AsyncClient(
-        transport=ASGITransport(app=app), base_url="http://test"
+        transport=ASGITransport(app=canned_app), base_url="http://test"
     ) as client:
-        with respx.mock:
-            respx.post(
-                "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-            ).mock(
-                return_value=Response(
-                    200,
-                    json={"candidates": [{"content": {"parts": [{"text": "OK"}]}}]},
-                )
-            )
-
-            # Get initial total usage
-            status_response = await client.get("/admin/status")
-            initial_status = status_response.json()
-            initial_total_used = sum(k["rpd_used"] for k in initial_status["keys"])
-
-            # Send 20 concurrent requests
-            tasks = []
-            for _ in range(20):
-                task = client.post(
+        # Get initial total usage
+        status_response = await client.get("/admin/status")
+        initial_status = status_response.json()
+        initial_total_used = sum(k["rpd_used"] for k in initial_status["keys"])
+
+        # Send 20 concurrent requests
+        responses = await asyncio.gather(
+            *[
+                client.post(
                     "/v1beta/models/gemini-pro:generateContent",
-                    json={"contents": [{"parts": [{"text": "Test"}]}]},
+                    content=TEST_BODY,
+                    headers=TEST_HEADERS,
                 )
-                tasks.append(task)
-
-            responses = await asyncio.gather(*tasks)
+                for _ in range(20)
+            ]
+        )
 
-            # All should succeed
-            for response in responses:
-                assert response.status_code == 200
+        # All should succeed
+        for response in responses:
+            assert response.status_code == 200
 
-            # Check final usage
-            status_response = await client.get("/admin/status")
-            final_status = status_response.json()
-            final_total_used = sum(k["rpd_used"] for k in final_status["keys"])
+        # Check final usage
+        status_response = await client.get("/admin/status")
+        final_status = status_response.json()
+        final_total_used = sum(k["rpd_used"] for k in final_status["keys"])
 
-            # Total usage should have increased by exactly 20
-            assert final_total_used == initial_total_used + 20
+        # Total usage should have increased by exactly 20
+        assert final_total_used == initial_total_used + 20
@@ -2,6 +2,7 @@
 
 import asyncio
 import time
+from collections import deque
 from datetime import date, datetime, tzinfo
 from typing import Dict, List, Optional, cast
 
@@ -16,6 +17,21 @@ try:
 except ImportError:  # pragma: no cover - Python < 3.9 fallback
     from backports.zoneinfo import ZoneInfo  # type: ignore
 
+LA_TZ = cast(tzinfo, ZoneInfo("America/Los_Angeles"))
+
+
+def frozen_datetime(fixed_dt: datetime) -> type:
+    """Build a stand-in for datetime whose now() always returns fixed_dt."""
+
+    class FrozenDateTime:
+        @classmethod
+        def now(cls, tz: Optional[tzinfo] = None) -> datetime:
+            if tz:
+                return fixed_dt.astimezone(tz)
+            return fixed_dt
+
+    return FrozenDateTime
+
 
 def make_config(
     api_keys: List[str],
@@ -23,12 +39,17 @@ def make_config(
     default_rpm_limit: int = 10,
 ) -> Config:
     return Config(
-        api_keys=api_keys,
+        api_keys=tuple(api_keys),
         default_rpd_limit=default_rpd_limit,
         default_rpm_limit=default_rpm_limit,
     )
 
 
+@pytest.fixture
+def manager() -> KeyManager:
+    return KeyManager(make_config(["k1"]))
+
+
 @pytest.mark.asyncio
 async def test_init_creates_keys_from_config():
     config = make_config(["k1", "k2"], default_rpd_limit=123, default_rpm_limit=7)
@@ -44,7 +65,6 @@ async def test_init_creates_keys_from_config():
 @pytest.mark.asyncio
 async def test_select_key_highest_rpd():
     manager = KeyManager(make_config(["k1", "k2", "k3"], default_rpd_limit=100))
-
     manager.pool.keys["key_1"].rpd_used = 80
     manager.pool.keys["key_2"].rpd_used = 10
     manager.pool.keys["key_3"].rpd_used = 50
@@ -54,10 +74,21 @@ async def test_select_key_highest_rpd():
     assert selected.id == "key_2"
 
 
+@pytest.mark.asyncio
+async def test_select_key_tie_prefers_first_key():
+    manager = KeyManager(make_config(["k1", "k2", "k3"], default_rpd_limit=100))
+    manager.pool.keys["key_1"].rpd_used = 40
+    manager.pool.keys["key_2"].rpd_used = 10
+    manager.pool.keys["key_3"].rpd_used = 10
+
+    selected = await manager.select_key()
+    assert selected is not None
+    assert selected.id == "key_2"
+
+
 @pytest.mark.asyncio
 async def test_select_key_skips_exhausted():
     manager = KeyManager(make_config(["k1", "k2"]))
-
     manager.pool.keys["key_1"].status = STATUS_EXHAUSTED
     selected = await manager.select_key()
 
@@ -70,17 +101,30 @@ async def test_select_key_skips_rpm_limited():
     manager = KeyManager(make_config(["k1", "k2"], default_rpm_limit=2))
     now = time.time()
 
-    manager.pool.keys["key_1"].rpm_timestamps = [now, now]
+    manager.pool.keys["key_1"].rpm_timestamps = deque([now, now])
     selected = await manager.select_key()
 
     assert selected is not None
     assert selected.id == "key_2"
 
 
+@pytest.mark.asyncio
+async def test_select_key_ignores_expired_rpm_timestamps():
+    manager = KeyManager(make_config(["k1"], default_rpm_limit=2))
+    now = time.time()
+
+    key = manager.pool.keys["key_1"]
+    key.rpm_timestamps = deque([now - 120, now - 90, now - 5])
+    selected = await manager.select_key()
+
+    assert selected is not None
+    assert selected.id == "key_1"
+    assert list(key.rpm_timestamps) == [now - 5]
+
+
 @pytest.mark.asyncio
 async def test_select_key_returns_none_when_all_exhausted():
     manager = KeyManager(make_config(["k1", "k2"]))
-
     manager.pool.keys["key_1"].status = STATUS_EXHAUSTED
     manager.pool.keys["key_2"].status = STATUS_EXHAUSTED
 
@@ -89,9 +133,7 @@ async def test_select_key_returns_none_when_all_exhausted():
 
 
 @pytest.mark.asyncio
-async def test_record_request_increments_counters():
-    manager = KeyManager(make_config(["k1"]))
-
+async def test_record_request_increments_counters(manager: KeyManager):
     await manager.record_request("key_1")
 
     key = manager.pool.keys["key_1"]
@@ -101,8 +143,7 @@ async def test_record_request_increments_counters():
 
 
 @pytest.mark.asyncio
-async def test_record_request_marks_exhausted_at_limit():
-    manager = KeyManager(make_config(["k1"]))
+async def test_record_request_marks_exhausted_at_limit(manager: KeyManager):
     manager.pool.keys["key_1"].rpd_limit = 1
 
     await manager.record_request("key_1")
@@ -111,9 +152,7 @@ async def test_record_request_marks_exhausted_at_limit():
 
 
 @pytest.mark.asyncio
-async def test_record_error_updates_state():
-    manager = KeyManager(make_config(["k1"]))
-
+async def test_record_error_updates_state(manager: KeyManager):
     await manager.record_error("key_1")
 
     key = manager.pool.keys["key_1"]
@@ -122,17 +161,16 @@ async def test_record_error_updates_state():
 
 
 @pytest.mark.asyncio
-async def test_record_error_rpd_marks_exhausted():
-    manager = KeyManager(make_config(["k1"]))
-
+async def test_record_error_rpd_marks_exhausted(manager: KeyManager):
     await manager.record_error("key_1", is_rpd_limit=True)
 
     assert manager.pool.keys["key_1"].status == STATUS_EXHAUSTED
 
 
 @pytest.mark.asyncio
-async def test_daily_reset_resets_counters(monkeypatch: pytest.MonkeyPatch):
-    manager = KeyManager(make_config(["k1"]))
+async def test_daily_reset_resets_counters(
+    manager: KeyManager, monkeypatch: pytest.MonkeyPatch
+):
     manager.pool.last_reset_date = date(2026, 2, 13)
 
     key = manager.pool.keys["key_1"]
@@ -140,26 +178,11 @@ async def test_daily_reset_resets_counters(monkeypatch: pytest.MonkeyPatch):
     key.consecutive_failures = 2
     key.status = STATUS_EXHAUSTED
 
-    fixed_dt = datetime(
-        2026,
-        2,
-        14,
-        10,
-        0,
-        0,
-        tzinfo=cast(tzinfo, ZoneInfo("America/Los_Angeles")),
-    )
-
-    class FrozenDateTime:
-        @classmethod
-        def now(cls, tz: Optional[tzinfo] = None) -> datetime:
-            if tz:
-                return fixed_dt.astimezone(tz)
-            return fixed_dt
+    fixed_dt = datetime(2026, 2, 14, 10, 0, 0, tzinfo=LA_TZ)
 
     import app.key_manager as key_manager_module
 
-    monkeypatch.setattr(key_manager_module, "datetime", FrozenDateTime)
+    monkeypatch.setattr(key_manager_module, "datetime", frozen_datetime(fixed_dt))
 
     await manager.check_and_reset_daily()
 
@@ -170,34 +193,20 @@ async def test_daily_reset_resets_counters(monkeypatch: pytest.MonkeyPatch):
 
 
 @pytest.mark.asyncio
-async def test_daily_reset_skips_same_day(monkeypatch: pytest.MonkeyPatch):
-    manager = KeyManager(make_config(["k1"]))
+async def test_daily_reset_skips_same_day(
+    manager: KeyManager, monkeypatch: pytest.MonkeyPatch
+):
     manager.pool.last_reset_date = date(2026, 2, 13)
 
     key = manager.pool.keys["key_1"]
     key.rpd_used = 5
     key.status = STATUS_EXHAUSTED
 
-    fixed_dt = datetime(
-        2026,
-        2,
-        13,
-        12,
-        0,
-        0,
-        tzinfo=cast(tzinfo, ZoneInfo("America/Los_Angeles")),
-    )
-
-    class FrozenDateTime:
-        @classmethod
-        def now(cls, tz: Optional[tzinfo] = None) -> datetime:
-            if tz:
-                return fixed_dt.astimezone(tz)
-            return fixed_dt
+    fixed_dt = datetime(2026, 2, 13, 12, 0, 0, tzinfo=LA_TZ)
 
     import app.key_manager as key_manager_module
 
-    monkeypatch.setattr(key_manager_module, "datetime", FrozenDateTime)
+    monkeypatch.setattr(key_manager_module, "datetime", frozen_datetime(fixed_dt))
 
     await manager.check_and_reset_daily()
 
@@ -207,9 +216,15 @@ async def test_daily_reset_skips_same_day(monkeypatch: pytest.MonkeyPatch):
 
 
 @pytest.mark.asyncio
-async def test_add_key_success():
-    manager = KeyManager(make_config(["k1"]))
+async def test_daily_reset_same_day_does_not_wait_for_lock(manager: KeyManager):
+    async with manager._pool_lock:
+        await asyncio.wait_for(manager.check_and_reset_daily(), timeout=1)
+
+    assert manager.pool.keys["key_1"].rpd_used == 0
 
+
+@pytest.mark.asyncio
+async def test_add_key_success(manager: KeyManager):
     key_id = await manager.add_key("k2", rpd_limit=300, rpm_limit=15)
 
     assert key_id in manager.pool.keys
@@ -218,27 +233,42 @@ async def test_add_key_success():
 
 
 @pytest.mark.asyncio
-async def test_add_key_duplicate_rejected():
-    manager = KeyManager(make_config(["k1"]))
-
+async def test_add_key_duplicate_rejected(manager: KeyManager):
     with pytest.raises(ValueError):
         _ = await manager.add_key("k1")
 
 
 @pytest.mark.asyncio
-async def test_remove_key_success():
-    manager = KeyManager(make_config(["k1"]))
-
+async def test_remove_key_success(manager: KeyManager):
     removed = await manager.remove_key("key_1")
 
     assert removed is True
     assert "key_1" not in manager.pool.keys
+    assert "key_1" not in manager._key_locks
+
+
+@pytest.mark.asyncio
+async def test_add_key_after_remove_does_not_reuse_id():
+    manager = KeyManager(make_config(["k1", "k2"]))
+    await manager.remove_key("key_2")
+    key_id = await manager.add_key("k3")
+
+    assert key_id == "key_3"
 
 
 @pytest.mark.asyncio
-async def test_remove_key_not_found():
-    manager = KeyManager(make_config(["k1"]))
+async def test_add_key_after_remove_accepts_same_secret():
+    manager = KeyManager(make_config(["k1", "k2"]))
+    await manager.remove_key("key_1")
+    key_id = await manager.add_key("k1")
 
+    assert manager.pool.keys[key_id].key == "k1"
+    with pytest.raises(ValueError):
+        _ = await manager.add_key("k1")
+
+
+@pytest.mark.asyncio
+async def test_remove_key_not_found(manager: KeyManager):
     removed = await manager.remove_key("missing")
 
     assert removed is False
@@ -247,12 +277,117 @@ async def test_remove_key_not_found():
 @pytest.mark.asyncio
 async def test_concurrent_requests():
     manager = KeyManager(make_config(["k1"], default_rpd_limit=1000))
+    _ = await asyncio.gather(*[manager.record_request("key_1") for _ in range(10)])
+
+    key = manager.pool.keys["key_1"]
+    assert key.rpd_used == 10
+    assert len(key.rpm_timestamps) == 10
 
-    _ = await asyncio.gather(*[manager.record_request("key_1") for _ in range(60)])
+
+@pytest.mark.asyncio
+async def test_record_requests_batch():
+    manager = KeyManager(make_config(["k1"], default_rpd_limit=1000))
+    await manager.record_requests_batch("key_1", 60)
 
     key = manager.pool.keys["key_1"]
     assert key.rpd_used == 60
     assert len(key.rpm_timestamps) == 60
+    assert key.last_used is not None
+
+
+@pytest.mark.asyncio
+async def test_record_requests_batch_marks_exhausted():
+    manager = KeyManager(make_config(["k1"], default_rpd_limit=5))
+    await manager.record_requests_batch("key_1", 5)
+
+    assert manager.pool.keys["key_1"].status == STATUS_EXHAUSTED
+
+
+@pytest.mark.asyncio
+async def test_writer_applies_queued_requests_in_batch():
+    manager = KeyManager(make_config(["k1", "k2"], default_rpd_limit=3))
+    manager.start_writer()
+    try:
+        for _ in range(3):
+            await manager.record_request("key_1")
+        await manager.record_request("key_2")
+        await manager.record_request("missing")
+
+        await manager.flush()
+
+        key_1 = manager.pool.keys["key_1"]
+        assert key_1.rpd_used == 3
+        assert len(key_1.rpm_timestamps) == 3
+        assert key_1.last_used is not None
+        assert key_1.status == STATUS_EXHAUSTED
+        assert manager.pool.keys["key_2"].rpd_used == 1
+    finally:
+        await manager.stop_writer()
+
+
+@pytest.mark.asyncio
+async def test_stop_writer_drains_and_reverts_to_direct_writes(manager: KeyManager):
+    manager.start_writer()
+
+    await manager.record_request("key_1")
+    await manager.stop_writer()
+    assert manager.pool.keys["key_1"].rpd_used == 1
+
+    await manager.record_request("key_1")
+    assert manager.pool.keys["key_1"].rpd_used == 2
+
+
+@pytest.mark.asyncio
+async def test_writer_survives_failed_record(
+    manager: KeyManager, monkeypatch: pytest.MonkeyPatch
+):
+    original = manager._apply_request
+    failures = [RuntimeError("boom")]
+
+    def flaky_apply(key, timestamp, count=1):
+        if failures:
+            raise failures.pop()
+        original(key, timestamp, count)
+
+    monkeypatch.setattr(manager, "_apply_request", flaky_apply)
+    manager.start_writer()
+    try:
+        await manager.record_request("key_1")
+        await manager.flush()
+        await manager.record_request("key_1")
+        await manager.flush()
+
+        assert manager.pool.keys["key_1"].rpd_used == 1
+    finally:
+        await manager.stop_writer()
+
+
+@pytest.mark.asyncio
+async def test_dead_writer_falls_back_and_stops_without_hanging(
+    manager: KeyManager,
+):
+    manager.start_writer()
+    await manager.record_request("key_1")
+    assert manager._writer_task is not None
+    manager._writer_task.cancel()
+    await asyncio.sleep(0)
+
+    await manager.record_request("key_1")
+    assert manager.pool.keys["key_1"].rpd_used == 1
+
+    await asyncio.wait_for(manager.flush(), timeout=1)
+    await asyncio.wait_for(manager.stop_writer(), timeout=1)
+    assert manager.pool.keys["key_1"].rpd_used == 2
+
+
+@pytest.mark.asyncio
+async def test_record_request_not_blocked_by_other_key_lock():
+    manager = KeyManager(make_config(["k1", "k2"]))
+    async with manager._key_lock("key_1"):
+        await asyncio.wait_for(manager.record_request("key_2"), timeout=1)
+
+    assert manager.pool.keys["key_1"].rpd_used == 0
+    assert manager.pool.keys["key_2"].rpd_used == 1
 
 
 @pytest.mark.asyncio
@@ -272,9 +407,41 @@ async def test_get_status_format():
 
 
 @pytest.mark.asyncio
-async def test_get_key_status():
-    manager = KeyManager(make_config(["k1"]))
+async def test_get_status_cached_single_flight(
+    manager: KeyManager, monkeypatch: pytest.MonkeyPatch
+):
+    calls = 0
+    original = manager.get_status
+
+    async def counting_get_status() -> Dict[str, object]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return await original()
+
+    monkeypatch.setattr(manager, "get_status", counting_get_status)
+
+    first, second = await asyncio.gather(
+        manager.get_status_cached(), manager.get_status_cached()
+    )
+    third = await manager.get_status_cached()
+
+    assert calls == 1
+    assert first is second is third
+
+
+@pytest.mark.asyncio
+async def test_get_status_cached_refreshes_after_ttl(manager: KeyManager):
+    first = await manager.get_status_cached(ttl=0)
+    manager.pool.keys["key_1"].status = STATUS_EXHAUSTED
+    second = await manager.get_status_cached(ttl=0)
 
+    assert first["exhausted_keys"] == 0
+    assert second["exhausted_keys"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_key_status(manager: KeyManager):
     key_status = await manager.get_key_status("key_1")
 
     assert key_status is not None
@@ -1,51 +1,34 @@
 import pytest
-import httpx
 import respx
-from httpx import Response
-from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient, Response
 from app.main import app as main_app
-from app.config import load_config
-from app.key_manager import KeyManager
+from app.models import ApiKey
 
 
-@pytest.fixture(autouse=True)
-def set_env(monkeypatch):
-    monkeypatch.setenv("GEMINI_API_KEYS", "test_key_1,test_key_2")
+@pytest.fixture(scope="module")
+async def client():
+    # ASGITransport does not run lifespan, so the state installed by the app
+    # fixture is what the routes see.
+    async with AsyncClient(
+        transport=ASGITransport(app=main_app), base_url="http://test"
+    ) as client:
+        yield client
 
 
-@pytest.fixture
-def app():
-    config = load_config(use_dotenv=False)
-    http_client = httpx.AsyncClient(base_url=config.gemini_base_url)
-    key_manager = KeyManager(config)
-
-    main_app.state.config = config
-    main_app.state.http_client = http_client
-    main_app.state.key_manager = key_manager
-
-    yield main_app
-
-    if hasattr(main_app.state, "config"):
-        del main_app.state.config
-    if hasattr(main_app.state, "http_client"):
-        del main_app.state.http_client
-    if hasattr(main_app.state, "key_manager"):
-        del main_app.state.key_manager
-
-
-def test_health_check(app):
-    client = TestClient(app)
-    response = client.get("/health")
+@pytest.mark.asyncio
+async def test_health_check(app, client):
+    response = await client.get("/health")
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "healthy"
     assert "keys_available" in data
     assert "total_keys" in data
-    assert data["total_keys"] == 2
+    assert data["total_keys"] == 3
 
 
+@pytest.mark.asyncio
 @respx.mock
-def test_proxy_route_forwards_request(app):
+async def test_proxy_route_forwards_request(app, client):
     gemini_mock = respx.post(
         "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
     ).mock(
@@ -57,8 +40,7 @@ def test_proxy_route_forwards_request(app):
         )
     )
 
-    client = TestClient(app)
-    response = client.post(
+    response = await client.post(
         "/v1beta/models/gemini-2.5-flash:generateContent",
         json={"contents": [{"parts": [{"text": "Hello"}]}]},
     )
@@ -68,14 +50,14 @@ def test_proxy_route_forwards_request(app):
     assert gemini_mock.called
 
 
+@pytest.mark.asyncio
 @respx.mock
-def test_proxy_route_injects_api_key(app):
+async def test_proxy_route_injects_api_key(app, client):
     gemini_mock = respx.post(
         "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
     ).mock(return_value=Response(200, json={"result": "ok"}))
 
-    client = TestClient(app)
-    response = client.post(
+    response = await client.post(
         "/v1beta/models/gemini-2.5-flash:generateContent",
         json={"contents": [{"parts": [{"text": "Hello"}]}]},
     )
@@ -84,4 +66,46 @@ def test_proxy_route_injects_api_key(app):
     assert gemini_mock.called
     request = gemini_mock.calls[0].request
     assert "x-goog-api-key" in request.headers
-    assert request.headers["x-goog-api-key"] in ["test_key_1", "test_key_2"]
+    assert request.headers["x-goog-api-key"] in [
+        "test_key_1",
+        "test_key_2",
+        "test_key_3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_gzipped(app, client):
+    for index in range(20):
+        app.state.key_manager.pool.keys[f"extra_{index}"] = ApiKey(
+            id=f"extra_{index}", key=f"extra_key_{index}"
+        )
+
+    response = await client.get("/admin/status", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["total_keys"] == 23
+
+
+@pytest.mark.asyncio
+async def test_small_responses_are_not_gzipped(app, client):
+    response = await client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [8, 4096], ids=["small", "large"])
+@respx.mock
+async def test_proxied_responses_are_not_gzipped(app, client, size: int):
+    respx.post(
+        "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
+    ).mock(return_value=Response(200, content=b"x" * size))
+
+    response = await client.post(
+        "/v1beta/models/gemini-2.5-flash:generateContent",
+        json={"contents": [{"parts": [{"text": "Hello"}]}]},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == b"x" * size
@@ -1,6 +1,8 @@
 import time
+from collections import deque
 from datetime import datetime, date
 
+from app.config import DATACLASS_SLOTS
 from app.models import (
     ApiKey,
     PoolState,
@@ -17,11 +19,13 @@ def test_api_key_defaults():
     assert key.rpd_limit == 250
     assert key.rpm_limit == 10
     assert key.rpd_used == 0
-    assert key.rpm_timestamps == []
+    assert key.rpm_timestamps == deque()
     assert key.last_used is None
     assert key.last_error is None
     assert key.consecutive_failures == 0
     assert key.status == STATUS_ACTIVE
+    if DATACLASS_SLOTS:
+        assert not hasattr(key, "__dict__")
 
 
 def test_api_key_rpd_remaining():
@@ -36,15 +40,22 @@ def test_api_key_rpm_current():
     key = ApiKey(
         id="key_1",
         key="test-key-123",
-        rpm_timestamps=[
-            current_time - 30,
-            current_time - 45,
-            current_time - 70,
-            current_time - 120,
-        ],
+        rpm_timestamps=deque(
+            [
+                current_time - 120,
+                current_time - 70,
+                current_time - 45,
+                current_time - 30,
+            ]
+        ),
     )
 
+    timestamps = key.rpm_timestamps
+
     assert key.rpm_current == 2
+    # Expired entries are popped in place rather than filtered into a copy.
+    assert key.rpm_timestamps is timestamps
+    assert list(key.rpm_timestamps) == [current_time - 45, current_time - 30]
 
 
 def test_api_key_key_prefix():
@@ -55,6 +66,12 @@ def test_api_key_key_prefix():
     assert key2.key_prefix() == "AIzaSyAB...789"
 
 
+def test_api_key_auth_headers():
+    key = ApiKey(id="key_1", key="test-key-123")
+
+    assert key.auth_headers == (("x-goog-api-key", "test-key-123"),)
+
+
 def test_pool_state_creation():
     pool = PoolState()
 
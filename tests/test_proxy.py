@@ -1,28 +1,28 @@
-from typing import Dict, List, Optional, Tuple
+import functools
+import json
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
 
 import httpx
 import pytest
-import respx
 from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
 from app.config import Config
 from app.models import ApiKey
-from app.proxy import proxy_request
+from app.proxy import _is_rpd_limit, proxy_request
 
 
 class FakeKeyManager:
     def __init__(self, keys: List[ApiKey]):
-        self.keys: List[ApiKey] = keys
+        self._keys: Iterator[ApiKey] = iter(keys)
         self.select_calls: int = 0
-        self.requests: List[str] = []
-        self.errors: List[Tuple[str, bool]] = []
+        self.requests: Deque[str] = deque()
+        self.errors: Deque[Tuple[str, bool]] = deque()
 
     async def select_key(self) -> Optional[ApiKey]:
-        if self.select_calls >= len(self.keys):
-            return None
-        key = self.keys[self.select_calls]
         self.select_calls += 1
-        return key
+        return next(self._keys, None)
 
     async def record_request(self, key_id: str) -> None:
         self.requests.append(key_id)
@@ -31,28 +31,87 @@ class FakeKeyManager:
         self.errors.append((key_id, is_rpd_limit))
 
 
+class QueueHandler:
+    """Upstream handler that replays queued responses and records each request.
+
+    Queued exceptions are raised instead of returned.
+    """
+
+    __slots__ = ("captured", "responses", "index")
+
+    def __init__(self, responses: List[Union[httpx.Response, Exception]]):
+        self.captured: List[httpx.Request] = []
+        self.responses = responses
+        self.index = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.captured.append(request)
+        result = self.responses[self.index]
+        self.index += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+# Pre-encoded ASGI header lists, passed straight into the request scope.
+# Names must already be lowercase, as ASGI requires; nothing normalizes them.
+HEADERS_BASIC: List[Tuple[bytes, bytes]] = [
+    (b"content-type", b"application/json"),
+    (b"x-goog-api-key", b"caller-key"),
+    (b"custom-header", b"custom-value"),
+    (b"host", b"incoming.example"),
+]
+HEADERS_HOP_BY_HOP: List[Tuple[bytes, bytes]] = [
+    (b"connection", b"keep-alive"),
+    (b"proxy-authorization", b"secret"),
+    (b"upgrade", b"websocket"),
+    (b"te", b"trailers"),
+    (b"host", b"incoming.example"),
+]
+HEADERS_KEY_ONLY: List[Tuple[bytes, bytes]] = [
+    (b"x-goog-api-key", b"caller-key"),
+    (b"content-type", b"application/json"),
+]
+
+
+# Scope shared by every test request; make_request copies it and overrides
+# only the fields a test sets.
+BASE_SCOPE: Dict[str, Any] = {
+    "type": "http",
+    "method": "POST",
+    "path": "/v1beta/models",
+    "raw_path": b"/v1beta/models",
+    "query_string": b"",
+    "headers": [],
+    "path_params": {"path": "v1beta/models"},
+    "client": ("testclient", 123),
+}
+
+# Shared receive message for the default body, which every test sends.
+_DEFAULT_BODY_MESSAGE: Dict[str, Any] = {
+    "type": "http.request",
+    "body": b"{}",
+    "more_body": False,
+}
+
+
+async def _receive_default_body() -> Dict[str, Any]:
+    return _DEFAULT_BODY_MESSAGE
+
+
 def make_request(
-    method: str = "POST",
-    path: str = "/v1beta/models",
     query_string: str = "",
-    headers: Optional[Dict[str, str]] = None,
+    headers: Optional[List[Tuple[bytes, bytes]]] = None,
     body: bytes = b"{}",
-    path_params: Optional[Dict[str, str]] = None,
-):
-    headers = headers or {}
-    raw_headers: List[Tuple[bytes, bytes]] = [
-        (k.lower().encode(), v.encode()) for k, v in headers.items()
-    ]
-    scope = {
-        "type": "http",
-        "method": method,
-        "path": path,
-        "raw_path": path.encode(),
-        "query_string": query_string.encode(),
-        "headers": raw_headers,
-        "path_params": path_params or {},
-        "client": ("testclient", 123),
-    }
+) -> Request:
+    scope = dict(BASE_SCOPE)
+    if query_string:
+        scope["query_string"] = query_string.encode()
+    if headers:
+        scope["headers"] = headers
+
+    if body == _DEFAULT_BODY_MESSAGE["body"]:
+        return Request(scope, _receive_default_body)
 
     async def receive():
         return {"type": "http.request", "body": body, "more_body": False}
@@ -60,9 +119,11 @@ def make_request(
     return Request(scope, receive)
 
 
+@functools.lru_cache(maxsize=None)
 def make_config(max_retries: int = 2, retry_delay_seconds: int = 0) -> Config:
+    # Config is frozen, so tests asking for the same values share one instance.
     return Config(
-        api_keys=["k1", "k2"],
+        api_keys=("k1", "k2"),
         max_retries=max_retries,
         retry_delay_seconds=retry_delay_seconds,
         gemini_base_url="https://gemini.example.test",
@@ -73,283 +134,257 @@ def make_key(key_id: str, key_value: str) -> ApiKey:
     return ApiKey(id=key_id, key=key_value)
 
 
-@pytest.mark.asyncio
-@respx.mock
-async def test_proxy_successful_forward():
-    config = make_config()
-    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
-    headers = {
-        "content-type": "application/json",
-        "x-goog-api-key": "caller-key",
-        "custom-header": "custom-value",
-        "host": "incoming.example",
-    }
-    request = make_request(
-        headers=headers,
-        path_params={"path": "v1beta/models"},
-    )
-
-    captured: List[httpx.Request] = []
-    responses = [httpx.Response(200, json={"ok": True})]
+def assert_forwarded(sent: httpx.Request) -> None:
+    assert sent.headers["x-goog-api-key"] == "server-key-1"
+    assert sent.headers["custom-header"] == "custom-value"
+    assert sent.headers["host"] == "gemini.example.test"
 
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
 
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
-    )
+def assert_hop_by_hop_stripped(sent: httpx.Request) -> None:
+    assert "proxy-authorization" not in sent.headers
+    assert "upgrade" not in sent.headers
+    assert "te" not in sent.headers
+    assert sent.headers["host"] == "gemini.example.test"
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
 
-    assert response.status_code == 200
-    assert len(captured) == 1
-    sent = captured[0]
+def assert_caller_key_replaced(sent: httpx.Request) -> None:
     assert sent.headers["x-goog-api-key"] == "server-key-1"
-    assert sent.headers["custom-header"] == "custom-value"
-    assert sent.headers["host"] == "gemini.example.test"
 
 
-@pytest.mark.asyncio
-@respx.mock
-async def test_proxy_429_retry_switches_key():
-    config = make_config(max_retries=3)
-    key_manager = FakeKeyManager(
-        [make_key("k1", "server-key-1"), make_key("k2", "server-key-2")]
-    )
-    request = make_request(path_params={"path": "v1beta/models"})
+def assert_key_query_param_stripped(sent: httpx.Request) -> None:
+    sent_url = str(sent.url)
+    assert "key=" not in sent_url
+    assert "foo=bar" in sent_url
 
-    captured: List[httpx.Request] = []
-    responses = [
-        httpx.Response(429, json={"error": {"message": "Per day limit"}}),
-        httpx.Response(200, json={"ok": True}),
-    ]
 
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "headers,query_string,check",
+    [
+        (HEADERS_BASIC, "", assert_forwarded),
+        (HEADERS_HOP_BY_HOP, "", assert_hop_by_hop_stripped),
+        (HEADERS_KEY_ONLY, "", assert_caller_key_replaced),
+        (None, "key=caller&foo=bar", assert_key_query_param_stripped),
+    ],
+    ids=["basic", "hop_by_hop", "strip_api_key", "strip_key_qs"],
+)
+async def test_proxy_forwards_request(
+    upstream,
+    upstream_client,
+    headers: Optional[List[Tuple[bytes, bytes]]],
+    query_string: str,
+    check: Callable[[httpx.Request], None],
+):
+    config = make_config()
+    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
+    request = make_request(query_string=query_string, headers=headers)
 
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
-    )
+    handler = QueueHandler([httpx.Response(200, json={"ok": True})])
+    upstream.handler = handler
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
 
     assert response.status_code == 200
-    assert key_manager.errors == [("k1", True)]
-    assert captured[0].headers["x-goog-api-key"] == "server-key-1"
-    assert captured[1].headers["x-goog-api-key"] == "server-key-2"
+    assert len(handler.captured) == 1
+    assert handler.captured[0].url.path == "/v1beta/models"
+    check(handler.captured[0])
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_429_rpm_retries_same_key():
-    config = make_config(max_retries=2, retry_delay_seconds=0)
-    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
-    request = make_request(path_params={"path": "v1beta/models"})
-
-    captured: List[httpx.Request] = []
-    responses = [
-        httpx.Response(429, json={"error": {"message": "Per minute limit"}}),
-        httpx.Response(200, json={"ok": True}),
-    ]
-
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
+@pytest.mark.parametrize(
+    "error_message,is_rpd_limit,retry_key,select_calls",
+    [
+        ("Per day limit", True, "server-key-2", 2),
+        ("Per minute limit", False, "server-key-1", 1),
+    ],
+    ids=["rpd_switches_key", "rpm_retries_same_key"],
+)
+async def test_proxy_429_retry(
+    upstream,
+    upstream_client,
+    error_message: str,
+    is_rpd_limit: bool,
+    retry_key: str,
+    select_calls: int,
+):
+    config = make_config(max_retries=3)
+    key_manager = FakeKeyManager(
+        [make_key("k1", "server-key-1"), make_key("k2", "server-key-2")]
+    )
+    request = make_request()
 
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
+    handler = QueueHandler(
+        [
+            httpx.Response(429, json={"error": {"message": error_message}}),
+            httpx.Response(200, json={"ok": True}),
+        ]
     )
+    upstream.handler = handler
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
 
     assert response.status_code == 200
-    assert key_manager.errors == [("k1", False)]
-    assert key_manager.select_calls == 1
-    assert captured[0].headers["x-goog-api-key"] == "server-key-1"
-    assert captured[1].headers["x-goog-api-key"] == "server-key-1"
+    assert list(key_manager.errors) == [("k1", is_rpd_limit)]
+    assert key_manager.select_calls == select_calls
+    assert handler.captured[0].headers["x-goog-api-key"] == "server-key-1"
+    assert handler.captured[1].headers["x-goog-api-key"] == retry_key
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_all_keys_exhausted_503():
-    config = make_config(max_retries=2, retry_delay_seconds=0)
+async def test_proxy_all_keys_exhausted_503(upstream, upstream_client):
+    config = make_config()
     key_manager = FakeKeyManager(
         [make_key("k1", "server-key-1"), make_key("k2", "server-key-2")]
     )
-    request = make_request(path_params={"path": "v1beta/models"})
-
-    responses = [
-        httpx.Response(429, json={"error": {"message": "Per day limit"}}),
-        httpx.Response(429, json={"error": {"message": "Per day limit"}}),
-    ]
+    request = make_request()
 
-    def handler(_: httpx.Request) -> httpx.Response:
-        return responses.pop(0)
-
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
+    handler = QueueHandler(
+        [
+            httpx.Response(429, json={"error": {"message": "Per day limit"}}),
+            httpx.Response(429, json={"error": {"message": "Per day limit"}}),
+        ]
     )
+    upstream.handler = handler
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
 
     assert response.status_code == 503
     assert response.headers["Retry-After"] == "60"
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_no_keys_available_503():
-    config = make_config(max_retries=1, retry_delay_seconds=0)
+async def test_proxy_no_keys_available_503(upstream, upstream_client):
+    config = make_config(max_retries=1)
     key_manager = FakeKeyManager([])
-    request = make_request(path_params={"path": "v1beta/models"})
+    request = make_request()
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
 
     assert response.status_code == 503
     assert response.headers["Retry-After"] == "60"
+    assert json.loads(response.body)["error"]["message"] == "All API keys exhausted"
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_strips_hop_by_hop_headers():
+async def test_proxy_timeout_retries(upstream, upstream_client):
     config = make_config()
-    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
-    headers = {
-        "connection": "keep-alive",
-        "proxy-authorization": "secret",
-        "upgrade": "websocket",
-        "te": "trailers",
-        "host": "incoming.example",
-    }
-    request = make_request(
-        headers=headers,
-        path_params={"path": "v1beta/models"},
+    key_manager = FakeKeyManager(
+        [make_key("k1", "server-key-1"), make_key("k2", "server-key-2")]
     )
+    request = make_request()
 
-    captured: List[httpx.Request] = []
-    responses = [httpx.Response(200, json={"ok": True})]
-
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
-
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
+    handler = QueueHandler(
+        [
+            httpx.TimeoutException("timeout"),
+            httpx.Response(200, json={"ok": True}),
+        ]
     )
+    upstream.handler = handler
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
 
     assert response.status_code == 200
-
-    sent_headers = captured[0].headers
-    assert "proxy-authorization" not in sent_headers
-    assert "upgrade" not in sent_headers
-    assert "te" not in sent_headers
-    assert sent_headers["host"] == "gemini.example.test"
+    assert handler.captured[0].headers["x-goog-api-key"] == "server-key-1"
+    assert handler.captured[1].headers["x-goog-api-key"] == "server-key-2"
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_strips_caller_api_key():
+async def test_proxy_relays_response_body(upstream, upstream_client):
     config = make_config()
     key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
-    headers = {
-        "x-goog-api-key": "caller-key",
-        "content-type": "application/json",
-    }
-    request = make_request(
-        headers=headers,
-        path_params={"path": "v1beta/models"},
-    )
+    request = make_request()
 
-    captured: List[httpx.Request] = []
-    responses = [httpx.Response(200, json={"ok": True})]
+    upstream.handler = QueueHandler([httpx.Response(200, json={"ok": True})])
 
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
-
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
-    )
+    response = await proxy_request(request, key_manager, upstream_client, config)
+    assert isinstance(response, StreamingResponse)
+    body = b"".join([chunk async for chunk in response.body_iterator])
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    assert json.loads(body) == {"ok": True}
+    assert response.media_type == "application/json"
+    assert list(key_manager.requests) == ["k1"]
 
-    assert response.status_code == 200
 
-    sent_headers = captured[0].headers
-    assert sent_headers["x-goog-api-key"] == "server-key-1"
+class BrokenStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b'{"partial":'
+        raise httpx.ReadTimeout("upstream stalled")
 
 
 @pytest.mark.asyncio
-@respx.mock
-async def test_proxy_strips_key_query_param():
+async def test_proxy_penalises_key_when_body_fails_midway(upstream, upstream_client):
     config = make_config()
     key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
-    request = make_request(
-        query_string="key=caller&foo=bar",
-        path_params={"path": "v1beta/models"},
-    )
+    request = make_request()
 
-    captured: List[httpx.Request] = []
-    responses = [httpx.Response(200, json={"ok": True})]
+    upstream.handler = QueueHandler([httpx.Response(200, stream=BrokenStream())])
 
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        return responses.pop(0)
+    response = await proxy_request(request, key_manager, upstream_client, config)
+    assert isinstance(response, StreamingResponse)
 
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
-    )
+    chunks: List[bytes] = []
+    with pytest.raises(httpx.ReadTimeout):
+        async for chunk in response.body_iterator:
+            chunks.append(chunk)
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    assert chunks == [b'{"partial":']
+    assert list(key_manager.errors) == [("k1", False)]
+    assert not key_manager.requests
 
-    assert response.status_code == 200
 
-    sent_url = str(captured[0].url)
-    assert "key=" not in sent_url
-    assert "foo=bar" in sent_url
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query_string", ["", "alt=sse"], ids=["json", "sse"])
+async def test_proxy_closes_upstream_if_body_never_iterated(
+    upstream, upstream_client, query_string: str
+):
+    config = make_config()
+    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
+    request = make_request(query_string=query_string)
 
+    upstream.handler = QueueHandler([httpx.Response(200, content=b"data: {}\n\n")])
 
-@pytest.mark.asyncio
-@respx.mock
-async def test_proxy_timeout_retries():
-    config = make_config(max_retries=2, retry_delay_seconds=0)
-    key_manager = FakeKeyManager(
-        [make_key("k1", "server-key-1"), make_key("k2", "server-key-2")]
-    )
-    request = make_request(path_params={"path": "v1beta/models"})
+    response = await proxy_request(request, key_manager, upstream_client, config)
+    assert isinstance(response, StreamingResponse)
+    assert response.background is not None
 
-    captured: List[httpx.Request] = []
-    responses = [
-        httpx.TimeoutException("timeout"),
-        httpx.Response(200, json={"ok": True}),
-    ]
+    await response.background()
+
+    assert response.background.func.__self__.is_closed
 
-    def handler(request: httpx.Request) -> httpx.Response:
-        captured.append(request)
-        result = responses.pop(0)
-        if isinstance(result, Exception):
-            raise result
-        return result
 
-    _ = respx.post("https://gemini.example.test/v1beta/models").mock(
-        side_effect=handler
+@pytest.mark.asyncio
+async def test_proxy_streaming_uses_shared_client(upstream, upstream_client):
+    config = make_config()
+    key_manager = FakeKeyManager([make_key("k1", "server-key-1")])
+    request = make_request(query_string="alt=sse")
+
+    handler = QueueHandler(
+        [
+            httpx.Response(
+                200,
+                content=b"data: {}\n\n",
+                headers={"content-type": "text/event-stream"},
+            )
+        ]
     )
+    upstream.handler = handler
 
-    async with httpx.AsyncClient(base_url=config.gemini_base_url) as client:
-        response = await proxy_request(request, key_manager, client, config)
+    response = await proxy_request(request, key_manager, upstream_client, config)
+    assert isinstance(response, StreamingResponse)
+    chunks = [chunk async for chunk in response.body_iterator]
 
-    assert response.status_code == 200
-    assert captured[0].headers["x-goog-api-key"] == "server-key-1"
-    assert captured[1].headers["x-goog-api-key"] == "server-key-2"
+    assert chunks == [b"data: {}\n\n"]
+    assert handler.captured[0].headers["x-goog-api-key"] == "server-key-1"
+    assert handler.captured[0].url.params["alt"] == "sse"
+    assert list(key_manager.requests) == ["k1"]
+
+
+def test_is_rpd_limit_matches_daily_wording():
+    assert _is_rpd_limit(
+        httpx.Response(429, json={"error": {"message": "Daily quota exceeded"}})
+    )
+    assert _is_rpd_limit(httpx.Response(429, content=b"Requests PER DAY exceeded"))
+    assert not _is_rpd_limit(
+        httpx.Response(429, json={"error": {"message": "Per minute limit"}})
+    )
+    assert not _is_rpd_limit(httpx.Response(429, content=b"not json"))
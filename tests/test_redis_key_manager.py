@@ -0,0 +1,155 @@
+# pyright: reportMissingImports=false
+
+import time
+from typing import Tuple
+
+import pytest
+
+from app.config import Config
+from app.models import STATUS_ACTIVE, STATUS_EXHAUSTED
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.redis_key_manager import RedisKeyManager  # noqa: E402
+
+
+def make_config(
+    default_rpd_limit: int = 250,
+    default_rpm_limit: int = 10,
+    api_keys: Tuple[str, ...] = ("k1", "k2"),
+) -> Config:
+    return Config(
+        api_keys=api_keys,
+        default_rpd_limit=default_rpd_limit,
+        default_rpm_limit=default_rpm_limit,
+    )
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_manager(server, **config_kwargs) -> RedisKeyManager:
+    redis = fakeredis.FakeAsyncRedis(server=server)
+    return RedisKeyManager(make_config(**config_kwargs), redis)
+
+
+@pytest.mark.asyncio
+async def test_usage_is_shared_between_workers(server):
+    worker_a = make_manager(server, default_rpd_limit=100)
+    worker_b = make_manager(server, default_rpd_limit=100)
+
+    for _ in range(3):
+        await worker_a.record_request("key_1")
+
+    selected = await worker_b.select_key()
+
+    assert selected is not None
+    assert selected.id == "key_2"
+    assert worker_b.pool.keys["key_1"].rpd_used == 3
+    assert worker_b.pool.keys["key_1"].rpm_current == 3
+
+
+@pytest.mark.asyncio
+async def test_rpd_exhaustion_is_shared(server):
+    worker_a = make_manager(server, default_rpd_limit=1)
+    worker_b = make_manager(server, default_rpd_limit=1)
+
+    await worker_a.record_request("key_1")
+    await worker_a.record_request("key_2")
+
+    assert await worker_b.select_key() is None
+    assert worker_b.pool.keys["key_1"].status == STATUS_EXHAUSTED
+
+
+@pytest.mark.asyncio
+async def test_rpd_error_is_shared(server):
+    worker_a = make_manager(server)
+    worker_b = make_manager(server)
+
+    await worker_a.record_error("key_1", is_rpd_limit=True)
+
+    selected = await worker_b.select_key()
+    assert selected is not None
+    assert selected.id == "key_2"
+    assert worker_b.pool.keys["key_1"].consecutive_failures == 1
+
+
+@pytest.mark.asyncio
+async def test_rpm_window_expires_old_entries(server):
+    worker = make_manager(server, default_rpm_limit=1)
+    rpm_key = worker._rpm_key(worker.pool.keys["key_1"])
+    stale = time.time() - 120
+    await worker._redis.zadd(rpm_key, {"stale": stale})
+
+    await worker._sync_from_redis()
+
+    assert worker.pool.keys["key_1"].rpm_current == 0
+
+
+@pytest.mark.asyncio
+async def test_force_reset_clears_shared_counters(server):
+    worker_a = make_manager(server, default_rpd_limit=1)
+    worker_b = make_manager(server, default_rpd_limit=1)
+    await worker_a.record_request("key_1")
+
+    await worker_a.force_reset()
+    selected = await worker_b.select_key()
+
+    assert selected is not None
+    assert selected.id == "key_1"
+    assert worker_b.pool.keys["key_1"].status == STATUS_ACTIVE
+    assert worker_b.pool.keys["key_1"].rpd_used == 0
+
+
+@pytest.mark.asyncio
+async def test_record_requests_batch_is_shared(server):
+    worker_a = make_manager(server, default_rpd_limit=100)
+    worker_b = make_manager(server, default_rpd_limit=100)
+
+    await worker_a.record_requests_batch("key_1", 4)
+    await worker_b._sync_from_redis()
+
+    assert worker_b.pool.keys["key_1"].rpd_used == 4
+    assert worker_b.pool.keys["key_1"].rpm_current == 4
+
+
+@pytest.mark.asyncio
+async def test_counters_follow_secret_not_pool_id(server):
+    worker_a = make_manager(server, default_rpd_limit=100)
+    worker_b = make_manager(server, default_rpd_limit=100, api_keys=("k2", "k1"))
+
+    await worker_a.record_requests_batch("key_1", 3)
+    await worker_b._sync_from_redis()
+
+    assert worker_b.pool.keys["key_2"].rpd_used == 3
+    assert worker_b.pool.keys["key_1"].rpd_used == 0
+
+
+@pytest.mark.asyncio
+async def test_added_keys_with_same_id_do_not_share_counters(server):
+    worker_a = make_manager(server, default_rpd_limit=100)
+    worker_b = make_manager(server, default_rpd_limit=100)
+    assert await worker_a.add_key("extra_a", rpd_limit=100) == "key_3"
+    assert await worker_b.add_key("extra_b", rpd_limit=100) == "key_3"
+
+    await worker_a.record_requests_batch("key_3", 5)
+    await worker_b._sync_from_redis()
+
+    assert worker_b.pool.keys["key_3"].rpd_used == 0
+
+
+@pytest.mark.asyncio
+async def test_status_reflects_other_workers(server):
+    worker_a = make_manager(server, default_rpd_limit=1)
+    worker_b = make_manager(server, default_rpd_limit=1)
+
+    await worker_a.record_request("key_1")
+
+    status = await worker_b.get_status()
+    key_status = await worker_b.get_key_status("key_1")
+
+    assert status["exhausted_keys"] == 1
+    assert key_status is not None
+    assert key_status["rpd_used"] == 1
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.models import STATUS_EXHAUSTED
+
+
+def test_allocate_keys_returns_distinct_keys_best_first(app):
+    app.state.key_manager.pool.keys["key_1"].rpd_used = 100
+    client = TestClient(app)
+    response = client.post("/sdk/allocate-keys", json={"count": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["keys"] == [
+        {"key_id": "key_2", "api_key": "test_key_2"},
+        {"key_id": "key_3", "api_key": "test_key_3"},
+    ]
+
+
+def test_allocate_keys_caps_at_available(app):
+    app.state.key_manager.pool.keys["key_2"].status = STATUS_EXHAUSTED
+    client = TestClient(app)
+    response = client.post("/sdk/allocate-keys", json={"count": 10})
+    assert response.status_code == 200
+    assert [k["key_id"] for k in response.json()["keys"]] == ["key_1", "key_3"]
+
+
+@pytest.mark.parametrize("count", [0, True, "2"])
+def test_allocate_keys_invalid_count(app, count):
+    client = TestClient(app)
+    response = client.post("/sdk/allocate-keys", json={"count": count})
+    assert response.status_code == 400
+
+
+def test_allocate_keys_all_exhausted(app):
+    for key in app.state.key_manager.pool.keys.values():
+        key.status = STATUS_EXHAUSTED
+    client = TestClient(app)
+    response = client.post("/sdk/allocate-keys", json={"count": 2})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "60"
+
+
+def test_report_usage_batch_records_each_call(app):
+    client = TestClient(app)
+    response = client.post(
+        "/sdk/report-usage-batch", json={"key_ids": ["key_1", "key_2", "key_1"]}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": "recorded"}
+    keys = app.state.key_manager.pool.keys
+    assert keys["key_1"].rpd_used == 2
+    assert keys["key_2"].rpd_used == 1
+
+
+def test_report_usage_batch_unknown_key_records_nothing(app):
+    client = TestClient(app)
+    response = client.post(
+        "/sdk/report-usage-batch", json={"key_ids": ["key_1", "missing"]}
+    )
+    assert response.status_code == 404
+    assert "missing" in response.json()["detail"]
+    assert app.state.key_manager.pool.keys["key_1"].rpd_used == 0
+
+
+def test_report_usage_batch_requires_key_ids(app):
+    client = TestClient(app)
+    response = client.post("/sdk/report-usage-batch", json={})
+    assert response.status_code == 400